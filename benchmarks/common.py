@@ -0,0 +1,16 @@
+"""Спільне для бенчмарків: імпорт main з фіктивними змінними в тимчасовому каталозі."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_main():
+    os.environ.setdefault("BOT_TOKEN", "123:bench")
+    os.environ.setdefault("ADMIN_CHAT_ID", "1")
+    os.environ.setdefault("GROUP_CHAT_ID", "2")
+    os.chdir(tempfile.mkdtemp(prefix="bot-bench-"))
+    sys.path.insert(0, ROOT)
+    import main
+    return main
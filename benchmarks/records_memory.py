@@ -0,0 +1,74 @@
+"""
+Пам'ять і кількість алокацій двох представлень розкладу і подій (tracemalloc):
+старе — dict[str, list[str]] і список dict з рядковими датами (як читав
+load_schedule/load_events до типізованих записів), нове — {день: ScheduleEntry}
+з id проповідників і {день: (Event, ...)} (TextStore._read_schedule/_read_events).
+
+    python benchmarks/records_memory.py [кількість записів, за замовчуванням 100000]
+"""
+import gc
+import sys
+import tracemalloc
+from datetime import date
+
+from common import import_main
+
+main = import_main()
+
+
+def write_files(count: int):
+    names = main.PREACHERS
+    with open(main.SCHEDULE_FILE, "w", encoding="utf-8") as schedule, \
+            open(main.EVENTS_FILE, "w", encoding="utf-8") as events:
+        for i in range(count):
+            date_str = date.fromordinal(700000 + i).strftime(main.DATE_FORMAT)
+            schedule.write(f"{date_str}|{names[i % len(names)]},{names[(i + 5) % len(names)]}\n")
+            events.write(f"{date_str}|Подія {i % 50}\n")
+
+
+def load_old():
+    schedule = {}
+    with open(main.SCHEDULE_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                date_str, preachers_str = line.split("|", 1)
+                schedule[date_str] = preachers_str.split(",")
+    events = []
+    with open(main.EVENTS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                date_str, title = line.split("|", 1)
+                events.append({"date": date_str, "title": title})
+    return schedule, events
+
+
+def load_new():
+    store = main.TextStore(main.SCHEDULE_FILE, main.EVENTS_FILE)
+    return store._read_schedule(), store._read_events()
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    data = load()
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del data
+    return current, peak, blocks
+
+
+def run(count: int):
+    write_files(count)
+    main.roster.id_of(main.PREACHERS[0])  # реєстр уже заповнений — як у працюючому боті
+    print(f"{count} записів розкладу (по 2 проповідники) і {count} подій")
+    print(f"{'':8}{'утримано, МБ':>14}{'пік, МБ':>10}{'блоків':>10}")
+    for label, load in (("старе", load_old), ("нове", load_new)):
+        current, peak, blocks = measure(load)
+        print(f"{label:8}{current / 2**20:14.1f}{peak / 2**20:10.1f}{blocks:10}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
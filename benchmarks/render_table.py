@@ -0,0 +1,77 @@
+"""
+Таблиця експорту docx: старий шлях (doc.add_table і заповнення через
+table.cell() з окремим w:shd на кожну клітинку) проти render_table, яка
+збирає XML усієї таблиці одним рядком. Перевіряє, що канонізований XML
+таблиць однаковий, і порівнює час.
+
+    python benchmarks/render_table.py [кількість стовпців-дат ...]
+
+Старий шлях росте приблизно квадратично: 120 стовпців — десятки секунд.
+"""
+import sys
+import time
+
+from common import import_main
+
+main = import_main()
+
+import docx  # noqa: E402 — python-docx, лише після import_main
+from docx.oxml import OxmlElement  # noqa: E402
+from docx.oxml.ns import qn  # noqa: E402
+from lxml import etree  # noqa: E402
+
+PREACHERS = 15
+FILLS = ("FFFF00", "FF0000", "DDDDDD")
+
+
+def table_data(columns: int):
+    header = ["Проповідники"] + [f"{1 + i % 28:02d}.01.2026\n(Чт)" for i in range(columns)]
+    row_titles = main.PREACHERS[:PREACHERS]
+    fills = [
+        [FILLS[col % 3] if (row + col) % 7 in (0, 3) else None for col in range(columns)]
+        for row in range(len(row_titles))
+    ]
+    return header, row_titles, fills
+
+
+def render_table_cells(doc, header: list, row_titles: list, fills: list, style: str):
+    """Старий шлях, як у build_schedule_docx до render_table."""
+    table = doc.add_table(rows=1 + len(row_titles), cols=len(header))
+    table.style = style
+    for col_idx, text in enumerate(header):
+        table.cell(0, col_idx).text = text
+    for row_idx, title in enumerate(row_titles, start=1):
+        table.cell(row_idx, 0).text = title
+    for col_idx in range(1, len(header)):
+        for row_idx, row_fills in enumerate(fills, start=1):
+            fill = row_fills[col_idx - 1]
+            if fill:
+                tc_pr = table.cell(row_idx, col_idx)._tc.get_or_add_tcPr()
+                shd = OxmlElement("w:shd")
+                shd.set(qn("w:fill"), fill)
+                tc_pr.append(shd)
+
+
+def timed_table(render, columns: int):
+    doc = docx.Document()
+    started = time.perf_counter()
+    render(doc, *table_data(columns), style="Table Grid")
+    elapsed = time.perf_counter() - started
+    tbl = doc.element.body.find(qn("w:tbl"))
+    return elapsed, etree.tostring(tbl, method="c14n")
+
+
+def run(column_counts: list):
+    print(f"{PREACHERS} проповідників")
+    print(f"{'стовпців':>9}{'table.cell(), мс':>18}{'render_table, мс':>18}  XML однаковий")
+    for columns in column_counts:
+        old_time, old_xml = timed_table(render_table_cells, columns)
+        new_time, new_xml = timed_table(main.render_table, columns)
+        same = "так" if old_xml == new_xml else "НІ"
+        print(f"{columns:9}{old_time * 1000:18.1f}{new_time * 1000:18.1f}  {same}")
+        if old_xml != new_xml:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or [9, 30, 60])
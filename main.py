@@ -1,13 +1,40 @@
+import asyncio
+import bisect
 import calendar
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+import csv
+import difflib
+import functools
+import heapq
+import hmac
+import io
+import json
+from telegram import (
+    Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton,
+    InlineKeyboardButton, InlineKeyboardMarkup,
+)
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import (
+    Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters,
+)
 from dotenv import load_dotenv
 import os
-from datetime import datetime, time
-import docx  # python-docx
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-from docx.shared import Inches
+import secrets
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time as time_module
+import weakref
+import zipfile
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import get_args, get_origin
+from zoneinfo import ZoneInfo
+# python-docx (і lxml під ним) імпортується лише при першому /export docx —
+# див. render_table і build_schedule_docx
+from xml.sax.saxutils import escape as xml_escape
 
 
 # Завантаження змінних із .env файлу
@@ -16,6 +43,14 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')   # група де вводять дані
 GROUP_CHAT_ID = os.getenv('GROUP_CHAT_ID')   # група куди йдуть нагадування
 REMINDER_THREAD_ID = os.getenv('REMINDER_THREAD_ID')  # тема (підгрупа) для нагадувань
+REMINDER_TIME = os.getenv('REMINDER_TIME', '09:00')   # о котрій годині надсилати нагадування
+TIMEZONE = os.getenv('TIMEZONE')   # напр. Europe/Kyiv; якщо не задано — час сервера
+# Правила нагадувань через ";": "днів_наперед:що:куди[:тема]",
+# що — sermon, event або sermon+event; куди — group, admin або chat id.
+# Напр.: "7:sermon:admin;2:sermon+event:group;0:sermon+event:group"
+REMINDER_RULES = os.getenv('REMINDER_RULES', '2:sermon+event:group')
+REMINDER_OUTBOX_FILE = os.getenv('REMINDER_OUTBOX_FILE', 'reminders_outbox.jsonl')
+REMINDER_CATCHUP_DAYS = int(os.getenv('REMINDER_CATCHUP_DAYS', '7'))  # скільки днів простою надолужувати
 
 if not BOT_TOKEN or not ADMIN_CHAT_ID or not GROUP_CHAT_ID:
     print("Помилка: BOT_TOKEN, ADMIN_CHAT_ID або GROUP_CHAT_ID не встановлено. Перевірте файл .env.")
@@ -29,246 +64,2212 @@ except ValueError:
     print("Помилка: ADMIN_CHAT_ID і GROUP_CHAT_ID повинні бути цілими числами.")
     exit(1)
 
+try:
+    LOCAL_TZ = ZoneInfo(TIMEZONE) if TIMEZONE else None
+    _hour, _minute = map(int, REMINDER_TIME.split(":"))
+    REMINDER_TIME = time(_hour, _minute, tzinfo=LOCAL_TZ)
+except (ValueError, KeyError) as e:
+    print(f"Помилка: невірні REMINDER_TIME або TIMEZONE ({e}).")
+    exit(1)
+
 
 def is_admin_chat(update: Update) -> bool:
     """Перевіряє, що команда надійшла з адмін-групи."""
     return update.effective_chat.id == ADMIN_CHAT_ID
 
-user_states = {}
+# Метрики: PORT для Prometheus (не задано — лише команда /metrics). За
+# замовчуванням слухає тільки localhost; на Fly — METRICS_HOST=0.0.0.0,
+# порт не публікується назовні, його читає збирач метрик Fly
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+class Metrics:
+    """
+    Реєстр метрик у текстовому форматі Prometheus без сторонніх залежностей:
+    лічильники, поточні значення і гістограми з фіксованими межами (секунди).
+    Запис — кілька операцій зі словником під коротким замком, тож метрики
+    можна не вимикати. Значення, які вже рахують інші об'єкти (кеш сторінок,
+    кількість діалогів), забирають колектори в момент читання.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}       # {назва: (тип, опис)}
+        self._values = {}      # {(назва, мітки): число}
+        self._histograms = {}  # {(назва, мітки): [лічильники за межами..., кількість, сума]}
+        self._collectors = []
+
+    def describe(self, name: str, kind: str, text: str):
+        self._types[name] = (kind, text)
+
+    def collector(self, func):
+        """Реєструє func(metrics), яку викликають перед кожним читанням."""
+        self._collectors.append(func)
+        return func
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.BUCKETS) + 2)
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def _snapshot(self):
+        for func in self._collectors:
+            func(self)
+        with self._lock:
+            return dict(self._values), {k: list(v) for k, v in self._histograms.items()}
+
+    @staticmethod
+    def _labels(labels, extra: tuple = ()) -> str:
+        pairs = [*labels, *extra]
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        """Усі метрики у форматі Prometheus (text/plain; version=0.0.4)."""
+        values, histograms = self._snapshot()
+        series = {}
+        for (name, labels), value in sorted(values.items()):
+            series.setdefault(name, []).append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip((*self.BUCKETS, "+Inf"), histogram):
+                cumulative += count
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f"{name}_bucket{self._labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-1]:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+        out = []
+        for name in sorted(series):
+            kind, text = self._types.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(series[name])
+        return "\n".join(out) + "\n"
+
+    def summary(self) -> list:
+        """Короткі рядки для /metrics у чаті: лічильники і середнє/p95 гістограм."""
+        values, histograms = self._snapshot()
+        lines = []
+        for (name, labels), histogram in sorted(histograms.items()):
+            count = sum(histogram[:-1])
+            if not count:
+                continue
+            p95, seen = "+Inf", 0
+            for bound, bucket in zip(self.BUCKETS, histogram):
+                seen += bucket
+                if seen >= count * 0.95:
+                    p95 = f"{bound * 1000:g}"
+                    break
+            lines.append(
+                f"{name}{self._labels(labels)}: {count} шт, "
+                f"сер. {histogram[-1] / count * 1000:.1f} мс, p95 ≤ {p95} мс"
+            )
+        for (name, labels), value in sorted(values.items()):
+            lines.append(f"{name}{self._labels(labels)}: {value:g}")
+        return lines
+
+metrics = Metrics()
+for _kind in ("handler", "step", "job"):
+    metrics.describe(f"bot_{_kind}_seconds", "histogram", f"Тривалість виконання ({_kind})")
+    metrics.describe(f"bot_{_kind}_errors_total", "counter", f"Винятки ({_kind})")
+metrics.describe("bot_job_lag_seconds", "gauge", "Запізнення останнього запуску задачі від запланованого часу")
+metrics.describe("bot_storage_seconds", "histogram", "Операції сховища з обробників (у потоці)")
+metrics.describe("bot_storage_bytes_total", "counter", "Байти, прочитані й записані у файли даних")
+metrics.describe("bot_storage_rows_total", "counter", "Рядки, прочитані й змінені в SQLite")
+metrics.describe("bot_reminder_send_seconds", "histogram", "Доставка одного нагадування разом з повторами")
+metrics.describe("bot_reminders_total", "counter", "Нагадування за результатом надсилання")
+metrics.describe("bot_reminder_retries_total", "counter", "Повтори надсилання нагадувань за причиною")
+
+def timed(callback, kind: str = "handler", name: str = None):
+    """
+    Обгортка асинхронного обробника: тривалість у bot_{kind}_seconds і
+    винятки в bot_{kind}_errors_total з міткою {kind}=name (ім'я функції).
+    """
+    labels = {kind: name or callback.__name__}
+    seconds_metric = f"bot_{kind}_seconds"
+    errors_metric = f"bot_{kind}_errors_total"
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time_module.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            metrics.inc(errors_metric, **labels)
+            raise
+        finally:
+            metrics.observe(seconds_metric, time_module.perf_counter() - started, **labels)
+    return wrapper
+
+def count_bytes(path: str, direction: str, size: int):
+    """Обсяг файлового вводу-виводу (direction — read або write) за ім'ям файлу."""
+    metrics.inc("bot_storage_bytes_total", size, file=os.path.basename(path), direction=direction)
+
+# Стан діалогів (/add, /delete, ...): скільки живе незавершений діалог,
+# скільки діалогів і байтів тримати, і файл для збереження між перезапусками
+STATE_TTL_SECONDS = int(os.getenv("STATE_TTL_SECONDS", str(30 * 60)))
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "1000"))
+STATE_MAX_BYTES = int(os.getenv("STATE_MAX_BYTES", str(256 * 1024)))
+STATE_FILE = os.getenv("STATE_FILE")  # не задано — стан лише в пам'яті
+STATE_FLUSH_SECONDS = 5
+
+class ConversationStates:
+    """
+    Стани діалогів користувачів: {user id: рядок або dict з id і днями}.
+    Працює як словник, але кожен запис живе STATE_TTL_SECONDS від останньої
+    зміни, а при перевищенні кількості чи розміру (у байтах JSON) витісняються
+    найдавніше вживані. Стан тримає лише компактні ключі (порядкові номери
+    днів, id проповідників), не копії даних сховища. Якщо задано path,
+    стани зберігаються у JSON (тимчасовий файл + перейменування) і
+    переживають перезапуск бота.
+    """
+
+    def __init__(self, path: str = None, ttl: int = STATE_TTL_SECONDS,
+                 max_entries: int = STATE_MAX_ENTRIES, max_bytes: int = STATE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.dirty = False
+        self._entries = OrderedDict()  # {user id: (час завершення, стан, розмір)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, user_id: int):
+        _, _, size = self._entries.pop(user_id)
+        self._bytes -= size
+        self.dirty = True
+
+    def _live(self, user_id: int):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time_module.time():
+            self._drop(user_id)
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: int, default=None):
+        with self._lock:
+            entry = self._live(user_id)
+            return default if entry is None else entry[1]
+
+    def __contains__(self, user_id: int) -> bool:
+        with self._lock:
+            return self._live(user_id) is not None
+
+    def __getitem__(self, user_id: int):
+        with self._lock:
+            entry = self._live(user_id)
+            if entry is None:
+                raise KeyError(user_id)
+            return entry[1]
+
+    def __setitem__(self, user_id: int, state):
+        size = len(json.dumps(state, ensure_ascii=False))
+        with self._lock:
+            if user_id in self._entries:
+                self._drop(user_id)
+            self._entries[user_id] = (time_module.time() + self.ttl, state, size)
+            self._bytes += size
+            self.dirty = True
+            # Щойно записаний стан не витісняється, навіть якщо сам завеликий
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._entries)))
+
+    def __delitem__(self, user_id: int):
+        with self._lock:
+            if user_id not in self._entries:
+                raise KeyError(user_id)
+            self._drop(user_id)
+
+    def pop(self, user_id: int, default=None):
+        with self._lock:
+            entry = self._live(user_id)
+            if entry is None:
+                return default
+            self._drop(user_id)
+            return entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def expire(self):
+        """Прибирає всі прострочені діалоги."""
+        now = time_module.time()
+        with self._lock:
+            for user_id in [u for u, entry in self._entries.items() if entry[0] < now]:
+                self._drop(user_id)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            count_bytes(self.path, "read", f.tell())
+        except ValueError:
+            return  # пошкоджений файл — починаємо з чистого стану
+        now = time_module.time()
+        with self._lock:
+            for user_id, expires, state in records:
+                if expires >= now:
+                    size = len(json.dumps(state, ensure_ascii=False))
+                    self._entries[int(user_id)] = (expires, state, size)
+                    self._bytes += size
+            self.dirty = False
+
+    def flush(self):
+        """Записує стани на диск, якщо вони змінились з останнього запису."""
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            records = [[user_id, expires, state] for user_id, (expires, state, _) in self._entries.items()]
+            self.dirty = False
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            count_bytes(self.path, "write", f.tell())
+        os.replace(tmp_path, self.path)
+
+user_states = ConversationStates(STATE_FILE)
+user_states.load()
+
+# Кроки діалогів: назва стану -> (обробник, {поле стану: тип}).
+# Обробник отримує (update, user_id, state); стан — dict {"state": назва, ...поля}.
+CONVERSATION_STEPS = {}
+
+def conversation_step(name: str, **fields):
+    """
+    Реєструє обробник кроку діалогу; fields — поля, які має містити стан,
+    з їхніми типами: int, str, list[int], list[list[int]] (стани зберігаються
+    у JSON, тож кортежі не підходять — лише списки).
+    """
+    def register(handler):
+        CONVERSATION_STEPS[name] = (timed(handler, "step", name), fields)
+        return handler
+    return register
+
+def _matches_type(value, expected) -> bool:
+    origin = get_origin(expected)
+    if origin is None:
+        return isinstance(value, expected) and not (expected is int and isinstance(value, bool))
+    item_type = get_args(expected)[0]
+    return isinstance(value, origin) and all(_matches_type(item, item_type) for item in value)
+
+def valid_payload(fields: dict, payload: dict) -> bool:
+    """Чи є в payload усі поля кроку і чи мають вони потрібні типи."""
+    return all(field in payload and _matches_type(payload[field], t) for field, t in fields.items())
+
+def start_step(user_id: int, name: str, **payload):
+    """Переводить діалог користувача на крок name з полями payload."""
+    fields = CONVERSATION_STEPS[name][1]
+    if not valid_payload(fields, payload):
+        raise ValueError(f"крок {name} потребує полів {fields}, отримано {payload}")
+    user_states[user_id] = {"state": name, **payload}
 
 SCHEDULE_FILE = "schedule.txt"
 EVENTS_FILE = "events.txt"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "text").lower()  # "text" або "sqlite"
+SQLITE_FILE = os.getenv("SQLITE_FILE", "schedule.db")
+DATE_FORMAT = "%d.%m.%Y"
+ROSTER_FILE = "roster.txt"
+
+# Початковий список проповідників (з нього створюється roster.txt)
+PREACHERS = [
+    "Басько П.", "Біленко Ю.", "Мосійчук В.", "Мироненко І.",
+    "Барановський М.", "Пономарьов А.", "Замуруєв В.", "Григоров А.",
+    "Савостін В.", "Козак Є.", "Кулик Є.", "Ковальчук Ю.",
+    "Савостін І.", "Суржа П.", "Кітченко Я.", "Волос В.",
+    "Сардак Р."
+]
+
+# Відомі варіанти написання імен: псевдонім => ім'я в реєстрі
+PREACHER_ALIASES = {
+    "Босько П.": "Басько П.",
+}
+
+# Розмір журналу змін (байт), після якого він ущільнюється у файл-знімок
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(64 * 1024)))
+
+# Автоматичний план (/autoplan)
+AUTOPLAN_MIN_SPACING_DAYS = int(os.getenv("AUTOPLAN_MIN_SPACING_DAYS", "7"))  # мінімум днів між проповідями
+AUTOPLAN_HISTORY_MONTHS = int(os.getenv("AUTOPLAN_HISTORY_MONTHS", "12"))     # історія для вирівнювання
+AUTOPLAN_MAX_MONTHS = 12
+
+# Режим webhook: якщо задано WEBHOOK_URL (напр. https://church-reminder-bot.fly.dev),
+# бот не опитує Telegram, а приймає оновлення HTTP-запитами на WEBHOOK_URL + WEBHOOK_PATH
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Перевіряється в заголовку кожного запиту; якщо не задано — генерується при старті
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+HEALTH_PATH = "/healthz"
+
+# Скільки оновлень Telegram обробляти паралельно
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
+# Позначка "файли ще не читали"
+_NOT_LOADED = object()
+
+def _file_signature(path: str):
+    """(mtime, розмір) файлу або None, якщо файлу немає."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
 
-# Функція для встановлення кольору фону (заливки) клітинки:
-def set_cell_bg_color(cell, color_hex: str):
+class Journal:
     """
-    Заливка клітинки таблиці коліром у форматі HEX (без #), наприклад "FF0000" (червоний).
+    Журнал змін поверх файлу-знімка (schedule.txt / events.txt).
+    Кожна зміна — один рядок "op|дата|значення", дописаний у кінець файлу.
+    При ущільненні журнал спершу перейменовується у *.old, потім у фоні
+    пишеться новий знімок і *.old видаляється. Операції ідемпотентні,
+    тож повторне застосування *.old після аварії нічого не псує.
     """
-    # Отримуємо безпосередньо <w:tc> XML-елемент
-    tc_pr = cell._tc.get_or_add_tcPr()
-    # Створюємо <w:shd w:fill="COLOR_HEX"/>
-    shd = OxmlElement('w:shd')
-    shd.set(qn('w:fill'), color_hex)
-    tc_pr.append(shd)
 
-def load_schedule():
-    """Завантаження розкладу з txt файлу."""
-    schedule = {}
-    if not os.path.exists(SCHEDULE_FILE):
-        return schedule
-    with open(SCHEDULE_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
+    def __init__(self, snapshot_file: str):
+        self.snapshot_file = snapshot_file
+        self.path = snapshot_file + ".journal"
+        self.old_path = self.path + ".old"
+
+    def signature(self):
+        return (
+            _file_signature(self.snapshot_file),
+            _file_signature(self.old_path),
+            _file_signature(self.path),
+        )
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def records(self):
+        """Усі записи журналу (спершу *.old, потім поточний) у порядку запису."""
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
                 continue
-            date, preachers_str = line.split("|", 1)
-            schedule[date] = preachers_str.split(",")
-    return schedule
-
-def save_schedule_to_file(schedule: dict):
-    """Записує весь розклад у txt файл."""
-    with open(SCHEDULE_FILE, "w", encoding="utf-8") as f:
-        for date, preachers in schedule.items():
-            f.write(f"{date}|{','.join(preachers)}\n")
-
-def load_events():
-    """Завантаження подій з txt файлу."""
-    events = []
-    if not os.path.exists(EVENTS_FILE):
+            with open(path, "rb") as f:
+                data = f.read()
+            count_bytes(path, "read", len(data))
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data) and path == self.path:
+                # Обірваний запис (процес упав посеред запису) — відкидаємо його
+                with open(path, "r+b") as f:
+                    f.truncate(complete)
+            for line in data[:complete].decode("utf-8").splitlines():
+                if line:
+                    op, date, value = line.split("|", 2)
+                    yield op, date, value
+
+    def append(self, op: str, date: str, value: str = ""):
+        self.append_many([(op, date, value)])
+
+    def append_many(self, records: list):
+        """Дописує кілька записів одним записом на диск і одним fsync."""
+        data = "".join(f"{op}|{date}|{value}\n" for op, date, value in records).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        count_bytes(self.path, "write", len(data))
+
+    def rotate(self):
+        """Відкладає поточний журнал у *.old; нові записи йдуть у порожній журнал."""
+        if not os.path.exists(self.path):
+            return
+        if os.path.exists(self.old_path):
+            # Попереднє ущільнення не завершилось — дописуємо до відкладеного журналу
+            with open(self.path, "rb") as src, open(self.old_path, "ab") as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.old_path)
+
+    def write_snapshot(self, lines) -> str:
+        """Записує новий знімок у тимчасовий файл; повертає його шлях."""
+        tmp_path = self.snapshot_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            count_bytes(self.snapshot_file, "write", f.tell())
+        return tmp_path
+
+    def install_snapshot(self, tmp_path: str):
+        """Атомарно замінює знімок записаним і видаляє відкладений журнал."""
+        os.replace(tmp_path, self.snapshot_file)
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
+
+def parse_date(date_str: str) -> date:
+    """Дата з рядка у форматі ДД.ММ.РРРР."""
+    return datetime.strptime(date_str, DATE_FORMAT).date()
+
+def month_bounds(year: int, month: int):
+    """Перший і останній день місяця."""
+    _, days_in_month = calendar.monthrange(year, month)
+    return date(year, month, 1), date(year, month, days_in_month)
+
+def date_str_from_day(day: int) -> str:
+    """Рядок ДД.ММ.РРРР з порядкового номера дня."""
+    return date.fromordinal(day).strftime(DATE_FORMAT)
+
+class Roster:
+    """
+    Реєстр проповідників — єдине джерело імен. Кожне ім'я отримує
+    невеликий цілий id, тож записи розкладу зберігають числа, а не рядки.
+    Пошук за ім'ям чи псевдонімом — через хеш-індекс нормалізованих
+    імен (без регістру, крапок і зайвих пробілів).
+    Імена з історії, яких немає в реєстрі, реєструються як неактивні;
+    якщо це інше написання відомого імені, merge() зливає їх.
+    Зберігається у txt файлі:
+    "ім'я|1 або 0 (активний)|псевдонім;псевдонім|ДД.ММ.РРРР-ДД.ММ.РРРР;..."
+    (останнє поле — періоди, коли проповідник недоступний). Id — це номер
+    рядка, тож рядки ніколи не видаляються: злитий проповідник лишається
+    рядком "ім'я|x||", щоб id наступних (і збережені в діалогах) не зсунулись.
+    """
+
+    # Роздільники полів roster.txt і списку проповідників у schedule.txt;
+    # у псевдонімах ще й "-" (роздільник дат у періодах недоступності)
+    NAME_FORBIDDEN = "|,;"
+    ALIAS_FORBIDDEN = NAME_FORBIDDEN + "-"
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._names = []
+        self._active = []
+        self._aliases = []
+        self._blackouts = []
+        self._merged = set()  # id, злиті з іншими (Roster.merge); у файлі позначка "x"
+        self._ids = {}
+        self._sorted_keys = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return " ".join(name.replace(".", " ").split()).casefold()
+
+    def load(self, default_names: list = (), default_aliases: dict = None):
+        """Читає реєстр з файлу; якщо файлу немає — створює з початкового списку."""
+        with self._lock:
+            if self.path and os.path.exists(self.path):
+                count_bytes(self.path, "read", os.path.getsize(self.path))
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for number, line in enumerate(f, start=1):
+                        line = line.strip()
+                        if line:
+                            self._load_line(number, line)
+                return
+            for name in default_names:
+                self._register(name, True)
+            for alias, name in (default_aliases or {}).items():
+                preacher_id = self.find(name)
+                if preacher_id is not None and self.find(alias) is None:
+                    self._add_alias(preacher_id, alias)
+            self.save()
+
+    def _load_line(self, number: int, line: str):
+        """
+        Один рядок roster.txt. Пошкоджений рядок (напр. дописаний вручну)
+        не зупиняє бот: ім'я все одно реєструється — щоб id наступних не
+        зсунулись, — а зайве відкидається з повідомленням у лог.
+        """
+        name, active, aliases, periods = (line.split("|", 3) + ["", "", ""])[:4]
+        if active == "x":
+            self._register(name, False, merged=True)
+            return
+        preacher_id = self._register(name, active == "1")
+        for alias in filter(None, aliases.split(";")):
+            self._add_alias(preacher_id, alias)
+        for period in filter(None, periods.split(";")):
+            try:
+                first, last = period.split("-")
+                self._blackouts[preacher_id].append(
+                    (parse_date(first).toordinal(), parse_date(last).toordinal())
+                )
+            except ValueError:
+                print(f"{self.path}, рядок {number}: пропущено невірний період {period!r}")
+
+    @classmethod
+    def valid_name(cls, name: str) -> bool:
+        return bool(name) and not any(c in name for c in cls.NAME_FORBIDDEN)
+
+    @classmethod
+    def valid_alias(cls, alias: str) -> bool:
+        return bool(alias) and not any(c in alias for c in cls.ALIAS_FORBIDDEN)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for preacher_id, name in enumerate(self._names):
+                    if preacher_id in self._merged:
+                        f.write(f"{name}|x||\n")
+                        continue
+                    aliases, blackouts = self._aliases[preacher_id], self._blackouts[preacher_id]
+                    periods = ";".join(
+                        f"{date_str_from_day(first)}-{date_str_from_day(last)}"
+                        for first, last in blackouts
+                    )
+                    f.write(f"{name}|{int(self._active[preacher_id])}|{';'.join(aliases)}|{periods}\n")
+                count_bytes(self.path, "write", f.tell())
+            os.replace(tmp_path, self.path)
+
+    def _register(self, name: str, active: bool, merged: bool = False) -> int:
+        preacher_id = len(self._names)
+        self._names.append(name)
+        self._active.append(active)
+        self._aliases.append([])
+        self._blackouts.append([])
+        if merged:
+            # Ім'я злитого вже є псевдонімом того, з ким його злили
+            self._merged.add(preacher_id)
+        else:
+            self._ids[self._key(name)] = preacher_id
+            self._sorted_keys = None
+        return preacher_id
+
+    def _add_alias(self, preacher_id: int, alias: str):
+        self._aliases[preacher_id].append(alias)
+        self._ids[self._key(alias)] = preacher_id
+        self._sorted_keys = None
+
+    def id_of(self, name: str) -> int:
+        """Id проповідника; невідоме ім'я реєструється як неактивне."""
+        preacher_id = self._ids.get(self._key(name))
+        if preacher_id is None:
+            with self._lock:
+                preacher_id = self._ids.get(self._key(name))
+                if preacher_id is None:
+                    preacher_id = self._register(name, False)
+        return preacher_id
+
+    def find(self, name: str):
+        """Id проповідника за ім'ям чи псевдонімом або None."""
+        return self._ids.get(self._key(name))
+
+    def name_of(self, preacher_id: int) -> str:
+        return self._names[preacher_id]
+
+    def search(self, text: str, limit: int = 10) -> list:
+        """
+        Id проповідників, чиє ім'я або псевдонім починається з text
+        (пошук по відсортованих ключах, O(log n + k)); якщо таких немає —
+        найближчі за написанням.
+        """
+        with self._lock:
+            if self._sorted_keys is None:
+                self._sorted_keys = sorted(self._ids)
+            keys = self._sorted_keys
+        prefix = self._key(text)
+        found = []
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix) and len(found) < limit:
+            preacher_id = self._ids[keys[i]]
+            if preacher_id not in found:
+                found.append(preacher_id)
+            i += 1
+        if not found:
+            for key in difflib.get_close_matches(prefix, keys, n=limit, cutoff=0.6):
+                if self._ids[key] not in found:
+                    found.append(self._ids[key])
+        return found
+
+    def spellings(self, preacher_id: int) -> list:
+        """Ім'я та всі псевдоніми проповідника."""
+        return [self._names[preacher_id]] + self._aliases[preacher_id]
+
+    def is_active(self, preacher_id: int) -> bool:
+        return self._active[preacher_id]
+
+    def active_ids(self) -> list:
+        return [i for i, active in enumerate(self._active) if active]
+
+    def active_names(self) -> list:
+        return [self._names[i] for i in self.active_ids()]
+
+    def blackouts(self, preacher_id: int) -> list:
+        """Періоди недоступності [(перший день, останній день), ...] (порядкові номери)."""
+        return list(self._blackouts[preacher_id])
+
+    def is_blacked_out(self, preacher_id: int, day: int) -> bool:
+        return any(first <= day <= last for first, last in self._blackouts[preacher_id])
+
+    def add_blackout(self, name: str, first: int, last: int) -> bool:
+        """Додає період недоступності; False, якщо ім'я невідоме."""
+        with self._lock:
+            preacher_id = self.find(name)
+            if preacher_id is None:
+                return False
+            self._blackouts[preacher_id].append((first, last))
+            self.save()
+            return True
+
+    def clear_blackouts(self, name: str) -> bool:
+        with self._lock:
+            preacher_id = self.find(name)
+            if preacher_id is None:
+                return False
+            self._blackouts[preacher_id].clear()
+            self.save()
+            return True
+
+    def ids(self) -> list:
+        """Id усіх проповідників (крім злитих з іншими) у порядку реєстрації."""
+        return [i for i in range(len(self._names)) if i not in self._merged]
+
+    def members(self) -> list:
+        """Список (ім'я, активний, [псевдоніми]) у порядку реєстрації."""
+        return [
+            (self._names[i], self._active[i], list(self._aliases[i])) for i in self.ids()
+        ]
+
+    def add(self, name: str) -> int:
+        """Додає проповідника (або знову активує, якщо він уже є)."""
+        with self._lock:
+            preacher_id = self.find(name)
+            if preacher_id is None:
+                preacher_id = self._register(name, True)
+            self._active[preacher_id] = True
+            self.save()
+            return preacher_id
+
+    def set_active(self, name: str, active: bool) -> bool:
+        with self._lock:
+            preacher_id = self.find(name)
+            if preacher_id is None:
+                return False
+            self._active[preacher_id] = active
+            self.save()
+            return True
+
+    def add_alias(self, name: str, alias: str) -> bool:
+        """
+        Додає псевдонім; False, якщо ім'я невідоме, псевдонім уже зайнятий
+        або містить роздільники файлу (ALIAS_FORBIDDEN).
+        """
+        with self._lock:
+            preacher_id = self.find(name)
+            if preacher_id is None or self.find(alias) is not None or not self.valid_alias(alias):
+                return False
+            self._add_alias(preacher_id, alias)
+            self.save()
+            return True
+
+    def rename(self, old_name: str, new_name: str):
+        """
+        Перейменовує проповідника. Стара назва стає псевдонімом, тож записи
+        з нею у файлах і далі належать тому самому id. Повертає (старе ім'я, id)
+        або None, якщо старе ім'я невідоме, нове вже зайняте іншим чи містить
+        роздільники файлу.
+        """
+        with self._lock:
+            preacher_id = self.find(old_name)
+            if preacher_id is None or not self.valid_name(new_name):
+                return None
+            other = self.find(new_name)
+            if other is not None and other != preacher_id:
+                return None
+            previous = self._names[preacher_id]
+            self._names[preacher_id] = new_name
+            self._ids[self._key(new_name)] = preacher_id
+            self._sorted_keys = None
+            if self._key(previous) != self._key(new_name):
+                self._aliases[preacher_id].append(previous)
+            self.save()
+            return previous, preacher_id
+
+    def merge(self, source_name: str, target_name: str):
+        """
+        Зливає неактивного проповідника, відомого лише з історії (інше
+        написання, збережене колись вільним текстом), з target: усі його
+        написання стають псевдонімами target. Записи сховища після цього
+        переносить ScheduleStore.merge_preacher. Повертає (id джерела, id цілі)
+        або None, якщо ім'я невідоме, це той самий id чи джерело активне.
+        """
+        with self._lock:
+            source, target = self.find(source_name), self.find(target_name)
+            if source is None or target is None or source == target or self._active[source]:
+                return None
+            for spelling in self.spellings(source):
+                self._add_alias(target, spelling)
+            self._blackouts[target].extend(self._blackouts[source])
+            self._aliases[source] = []
+            self._blackouts[source] = []
+            self._merged.add(source)
+            self.save()
+            return source, target
+
+roster = Roster(ROSTER_FILE)
+roster.load(PREACHERS, PREACHER_ALIASES)
+
+class ScheduleEntry:
+    """Запис розкладу: порядковий номер дня і id проповідників у порядку додавання."""
+
+    __slots__ = ("day", "preacher_ids")
+
+    def __init__(self, day: int, preacher_ids: tuple):
+        self.day = day
+        self.preacher_ids = preacher_ids
+
+    @property
+    def date_str(self) -> str:
+        return date_str_from_day(self.day)
+
+    @property
+    def weekday(self) -> int:
+        """0=Пн ... 6=Нд (день 1 — понеділок 01.01.0001)."""
+        return (self.day - 1) % 7
+
+    @property
+    def preachers(self) -> list:
+        return [roster.name_of(preacher_id) for preacher_id in self.preacher_ids]
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ScheduleEntry)
+            and (self.day, self.preacher_ids) == (other.day, other.preacher_ids)
+        )
+
+    def __hash__(self):
+        return hash((self.day, self.preacher_ids))
+
+    def __repr__(self):
+        return f"ScheduleEntry({self.date_str}, {self.preachers})"
+
+class Event:
+    """Церковна подія: порядковий номер дня і назва."""
+
+    __slots__ = ("day", "title")
+
+    def __init__(self, day: int, title: str):
+        self.day = day
+        self.title = title
+
+    @property
+    def date_str(self) -> str:
+        return date_str_from_day(self.day)
+
+    @property
+    def weekday(self) -> int:
+        return (self.day - 1) % 7
+
+    def __eq__(self, other):
+        return isinstance(other, Event) and (self.day, self.title) == (other.day, other.title)
+
+    def __hash__(self):
+        return hash((self.day, self.title))
+
+    def __repr__(self):
+        return f"Event({self.date_str}, {self.title!r})"
+
+class PreacherStats:
+    """
+    Лічильники проповідей: {id проповідника: {(рік, місяць): [чт, нд, інші]}}.
+    Оновлюються на кожній зміні розкладу, тож звіт за період коштує
+    O(реєстр × місяці періоду), а не перебір усього розкладу.
+    """
+
+    __slots__ = ("_counts",)
+
+    def __init__(self):
+        self._counts = {}
+
+    @classmethod
+    def from_entries(cls, entries) -> "PreacherStats":
+        stats = cls()
+        for entry in entries:
+            for preacher_id in entry.preacher_ids:
+                stats.update(preacher_id, entry.day, 1)
+        return stats
+
+    @staticmethod
+    def column(weekday: int) -> int:
+        return {3: 0, 6: 1}.get(weekday, 2)
+
+    def update(self, preacher_id: int, day: int, delta: int):
+        """Додає (delta=1) або знімає (delta=-1) одну проповідь."""
+        changed = date.fromordinal(day)
+        months = self._counts.setdefault(preacher_id, {})
+        row = months.setdefault((changed.year, changed.month), [0, 0, 0])
+        row[self.column(changed.weekday())] += delta
+        if not any(row):
+            del months[(changed.year, changed.month)]
+            if not months:
+                del self._counts[preacher_id]
+
+    def totals(self, months: list) -> dict:
+        """{id: [чт, нд, інші]} за вказані (рік, місяць); нулі не повертаються."""
+        result = {}
+        for preacher_id, by_month in self._counts.items():
+            total = [0, 0, 0]
+            for key in months:
+                row = by_month.get(key)
+                if row:
+                    total = [a + b for a, b in zip(total, row)]
+            if any(total):
+                result[preacher_id] = total
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, PreacherStats) and self._counts == other._counts
+
+class ScheduleStore:
+    """
+    Інтерфейс сховища розкладу і подій. Усі обробники працюють лише через нього.
+    Дати передаються рядками ДД.ММ.РРРР, межі діапазонів — об'єктами date
+    (включно; None — без обмеження). Діапазони повертають ScheduleEntry / Event,
+    відсортовані за датою; записи незмінні, їх можна тримати без копіювання.
+    Кожна зміна збільшує ревізію свого місяця — за нею кешуються похідні
+    дані (експорт), і редагування одного місяця не скидає кеш інших.
+    Статистика проповідників (PreacherStats) будується один раз і далі
+    оновлюється разом із кожною зміною.
+    """
+
+    def __init__(self):
+        self.revision = 0
+        self._generation = 0
+        self._month_revisions = {}
+        self._stats = None
+        self._lock = threading.RLock()
+
+    def _count(self, preacher_id: int, day: int, delta: int):
+        if self._stats is not None:
+            self._stats.update(preacher_id, day, delta)
+
+    def preacher_totals(self, months: list) -> dict:
+        """{id проповідника: [чт, нд, інші]} за вказані (рік, місяць)."""
+        with self._lock:
+            if self._stats is None:
+                self._stats = PreacherStats.from_entries(self.schedule_between())
+            return self._stats.totals(months)
+
+    def verify_stats(self) -> bool:
+        """
+        Перебудовує статистику з нуля і порівнює з накопиченою.
+        Повертає False, якщо вони розійшлись (далі діє перебудована).
+        """
+        with self._lock:
+            fresh = PreacherStats.from_entries(self.schedule_between())
+            consistent = self._stats is None or self._stats == fresh
+            self._stats = fresh
+            return consistent
+
+    def _bump(self, day: int):
+        """Позначає зміну даних у місяці, до якого належить день."""
+        changed = date.fromordinal(day)
+        key = (changed.year, changed.month)
+        self.revision += 1
+        self._month_revisions[key] = self._month_revisions.get(key, 0) + 1
+
+    def _bump_all(self):
+        """Дані перечитано повністю — всі місяці вважаються зміненими."""
+        self.revision += 1
+        self._generation += 1
+        self._month_revisions.clear()
+
+    def invalidate_all(self):
+        """Зовнішня зміна, що зачіпає всі місяці (напр. реєстр проповідників)."""
+        self._bump_all()
+
+    def current_revision(self) -> int:
+        """Загальна ревізія з урахуванням змін, зроблених поза процесом."""
+        return self.revision
+
+    def month_revision(self, year: int, month: int) -> tuple:
+        """Ревізія даних місяця; змінюється при кожному редагуванні цього місяця."""
+        return (self._generation, self._month_revisions.get((year, month), 0))
+
+    def preachers_on(self, date_str: str) -> list:
+        """Проповідники на дату (порожній список, якщо дати немає)."""
+        raise NotImplementedError
+
+    def has_schedule(self) -> bool:
+        """Чи є в розкладі хоч одна дата."""
+        raise NotImplementedError
+
+    def schedule_between(self, start=None, end=None) -> list:
+        """Список ScheduleEntry за діапазон."""
+        raise NotImplementedError
+
+    def events_between(self, start=None, end=None) -> list:
+        """Список Event за діапазон."""
+        raise NotImplementedError
+
+    def schedule_days(self, start=None, end=None, limit=None, reverse=False) -> list:
+        """Дні з записами розкладу (порядкові номери); параметри як у DateIndex.between."""
+        raise NotImplementedError
+
+    def event_days(self, start=None, end=None, limit=None, reverse=False) -> list:
+        """Дні з подіями (порядкові номери); параметри як у DateIndex.between."""
+        raise NotImplementedError
+
+    def preacher_days(self, preacher_id: int, start=None, end=None,
+                      limit=None, reverse=False) -> list:
+        """
+        Дні (порядкові номери), на які записаний проповідник, за зростанням;
+        reverse=True — від найпізнішого. Працює по індексу проповідник → дати.
+        """
+        raise NotImplementedError
+
+    def schedule_for_month(self, year: int, month: int) -> list:
+        return self.schedule_between(*month_bounds(year, month))
+
+    def add_preacher(self, date: str, preacher: str):
+        raise NotImplementedError
+
+    def add_preachers(self, assignments: list) -> int:
+        """
+        Пакетний запис [(дата, проповідник), ...] однією операцією на диску.
+        Повертає кількість справді доданих записів.
+        """
+        raise NotImplementedError
+
+    def delete_date(self, date: str) -> bool:
+        raise NotImplementedError
+
+    def delete_preacher(self, date: str, preacher: str) -> bool:
+        raise NotImplementedError
+
+    def rename_preacher(self, preacher_id: int):
+        """
+        Після перейменування в реєстрі масово переписує в усіх записах
+        сховища будь-яке написання проповідника на його поточне ім'я.
+        """
+        raise NotImplementedError
+
+    def merge_preacher(self, source_id: int, target_id: int):
+        """
+        Після злиття в реєстрі (Roster.merge) переносить записи source_id
+        на target_id і переписує їх на ім'я target_id.
+        """
+        raise NotImplementedError
+
+    def add_event(self, date: str, title: str):
+        raise NotImplementedError
+
+    def delete_event(self, date: str, title: str) -> bool:
+        raise NotImplementedError
+
+class DateIndex:
+    """
+    Відсортований індекс порядкових номерів днів.
+    Вибірка за діапазоном — два bisect і зріз, O(log n + k).
+    """
+
+    def __init__(self, days=()):
+        self._days = sorted(days)
+
+    def __len__(self):
+        return len(self._days)
+
+    def add(self, day: int):
+        i = bisect.bisect_left(self._days, day)
+        if i == len(self._days) or self._days[i] != day:
+            self._days.insert(i, day)
+
+    def remove(self, day: int):
+        i = bisect.bisect_left(self._days, day)
+        if i < len(self._days) and self._days[i] == day:
+            del self._days[i]
+
+    def between(self, start=None, end=None, limit=None, reverse=False) -> list:
+        """
+        Дні у діапазоні [start, end] (date або None) за зростанням.
+        limit обмежує кількість; reverse=True — останні дні, від найпізнішого.
+        """
+        lo = bisect.bisect_left(self._days, start.toordinal()) if start else 0
+        hi = bisect.bisect_right(self._days, end.toordinal()) if end else len(self._days)
+        if limit is not None:
+            if reverse:
+                lo = max(lo, hi - limit)
+            else:
+                hi = min(hi, lo + limit)
+        days = self._days[lo:hi]
+        return days[::-1] if reverse else days
+
+class TextStore(ScheduleStore):
+    """
+    Сховище у txt файлах; розклад і події тримаються в пам'яті процесу.
+    Файли читаються один раз, далі читання йде з пам'яті через DateIndex.
+    Кожна зміна — це дописаний рядок у журнал (O(1)), а не перезапис
+    усього файлу; коли журнал виростає, він ущільнюється у знімок у
+    фоновому потоці. Якщо файли змінились ззовні (mtime або розмір),
+    дані перечитуються.
+    """
+
+    def __init__(self, schedule_file: str, events_file: str):
+        super().__init__()
+        self.schedule_file = schedule_file
+        self.events_file = events_file
+        self._schedule_journal = Journal(schedule_file)
+        self._events_journal = Journal(events_file)
+        self._schedule = {}        # {день: ScheduleEntry}
+        self._events = {}          # {день: (Event, ...)}
+        self._schedule_index = DateIndex()
+        self._events_index = DateIndex()
+        self._preacher_index = {}  # {id проповідника: DateIndex}
+        self._schedule_sig = _NOT_LOADED
+        self._events_sig = _NOT_LOADED
+        self._compacting = set()
+
+    @staticmethod
+    def _read_snapshot(path: str):
+        if not os.path.exists(path):
+            return
+        count_bytes(path, "read", os.path.getsize(path))
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line.split("|", 1)
+
+    def _read_schedule(self) -> dict:
+        schedule = {}
+        for date_str, preachers_str in self._read_snapshot(self.schedule_file):
+            day = parse_date(date_str).toordinal()
+            for preacher in preachers_str.split(","):
+                self._apply_schedule(schedule, "+", day, preacher)
+        for op, date_str, value in self._schedule_journal.records():
+            self._apply_schedule(schedule, op, parse_date(date_str).toordinal(), value)
+        return schedule
+
+    def _read_events(self) -> dict:
+        events = {}
+        for date_str, title in self._read_snapshot(self.events_file):
+            self._apply_event(events, "+", parse_date(date_str).toordinal(), title)
+        for op, date_str, value in self._events_journal.records():
+            self._apply_event(events, op, parse_date(date_str).toordinal(), value)
         return events
-    with open(EVENTS_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            date, title = line.split("|", 1)
-            events.append({"date": date, "title": title})
-    return events
+
+    @staticmethod
+    def _apply_schedule(schedule: dict, op: str, day: int, preacher: str) -> bool:
+        """
+        Застосовує одну операцію журналу до розкладу:
+        "+" додає проповідника, "-" видаляє його, "x" видаляє всю дату.
+        Повертає True, якщо щось змінилось.
+        """
+        entry = schedule.get(day)
+        if op == "x":
+            return schedule.pop(day, None) is not None
+        ids = entry.preacher_ids if entry else ()
+        if op == "+":
+            preacher_id = roster.id_of(preacher)
+            if preacher_id in ids:
+                return False
+            schedule[day] = ScheduleEntry(day, ids + (preacher_id,))
+        elif op == "-":
+            preacher_id = roster.find(preacher)
+            if preacher_id not in ids:
+                return False
+            ids = tuple(i for i in ids if i != preacher_id)
+            if ids:
+                schedule[day] = ScheduleEntry(day, ids)
+            else:
+                del schedule[day]
+        return True
+
+    @staticmethod
+    def _apply_event(events: dict, op: str, day: int, title: str) -> bool:
+        """Застосовує одну операцію журналу до подій; повертає True, якщо щось змінилось."""
+        event = Event(day, title)
+        day_events = events.get(day, ())
+        if op == "+":
+            if event in day_events:
+                return False
+            events[day] = day_events + (event,)
+        elif op == "-":
+            if event not in day_events:
+                return False
+            day_events = tuple(e for e in day_events if e != event)
+            if day_events:
+                events[day] = day_events
+            else:
+                del events[day]
+        return True
+
+    def _refresh(self):
+        """Перечитує файли, якщо вони змінились з моменту останнього читання."""
+        sig = self._schedule_journal.signature()
+        if sig != self._schedule_sig:
+            self._schedule = self._read_schedule()
+            self._schedule_index = DateIndex(self._schedule)
+            self._preacher_index = {}
+            self._stats = PreacherStats()
+            for entry in self._schedule.values():
+                self._reindex_preachers(entry.day, None, entry)
+            self._schedule_sig = self._schedule_journal.signature()
+            self._bump_all()
+        sig = self._events_journal.signature()
+        if sig != self._events_sig:
+            self._events = self._read_events()
+            self._events_index = DateIndex(self._events)
+            self._events_sig = self._events_journal.signature()
+            self._bump_all()
+
+    def current_revision(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self.revision
+
+    def month_revision(self, year: int, month: int) -> tuple:
+        # Файли могли змінити ззовні — тоді ревізія має змінитись до того,
+        # як за нею візьмуть готовий експорт з кешу
+        with self._lock:
+            self._refresh()
+            return super().month_revision(year, month)
+
+    def preachers_on(self, date_str: str) -> list:
+        with self._lock:
+            self._refresh()
+            entry = self._schedule.get(parse_date(date_str).toordinal())
+            return entry.preachers if entry else []
+
+    def has_schedule(self) -> bool:
+        with self._lock:
+            self._refresh()
+            return bool(self._schedule)
+
+    def schedule_between(self, start=None, end=None) -> list:
+        with self._lock:
+            self._refresh()
+            return [self._schedule[day] for day in self._schedule_index.between(start, end)]
+
+    def events_between(self, start=None, end=None) -> list:
+        with self._lock:
+            self._refresh()
+            return [
+                event
+                for day in self._events_index.between(start, end)
+                for event in self._events[day]
+            ]
+
+    def schedule_days(self, start=None, end=None, limit=None, reverse=False) -> list:
+        with self._lock:
+            self._refresh()
+            return self._schedule_index.between(start, end, limit, reverse)
+
+    def event_days(self, start=None, end=None, limit=None, reverse=False) -> list:
+        with self._lock:
+            self._refresh()
+            return self._events_index.between(start, end, limit, reverse)
+
+    def _reindex_preachers(self, day: int, before, after):
+        """Оновлює індекс проповідник → дати і статистику для одного дня."""
+        old_ids = set(before.preacher_ids) if before else set()
+        new_ids = set(after.preacher_ids) if after else set()
+        for preacher_id in old_ids - new_ids:
+            self._preacher_index[preacher_id].remove(day)
+            self._count(preacher_id, day, -1)
+        for preacher_id in new_ids - old_ids:
+            self._preacher_index.setdefault(preacher_id, DateIndex()).add(day)
+            self._count(preacher_id, day, 1)
+
+    def preacher_totals(self, months: list) -> dict:
+        with self._lock:
+            self._refresh()
+            return super().preacher_totals(months)
+
+    def preacher_days(self, preacher_id: int, start=None, end=None,
+                      limit=None, reverse=False) -> list:
+        with self._lock:
+            self._refresh()
+            index = self._preacher_index.get(preacher_id)
+            return index.between(start, end, limit, reverse) if index else []
+
+    def _op(self, journal: Journal, op: str, date_str: str, value: str = "") -> bool:
+        return self._ops(journal, [(op, date_str, value)]) > 0
+
+    def _ops(self, journal: Journal, operations: list) -> int:
+        """
+        Застосовує операції [(op, дата, значення), ...] у пам'яті і дописує
+        змінені одним записом у журнал. Повертає кількість змін.
+        """
+        with self._lock:
+            self._refresh()
+            applied = []
+            for op, date_str, value in operations:
+                day = parse_date(date_str).toordinal()
+                if journal is self._schedule_journal:
+                    items, index = self._schedule, self._schedule_index
+                    before = items.get(day)
+                    changed = self._apply_schedule(items, op, day, value)
+                    if changed:
+                        self._reindex_preachers(day, before, items.get(day))
+                else:
+                    items, index = self._events, self._events_index
+                    changed = self._apply_event(items, op, day, value)
+                if not changed:
+                    continue
+                if day in items:
+                    index.add(day)
+                else:
+                    index.remove(day)
+                self._bump(day)
+                applied.append((op, date_str_from_day(day), value))
+            if not applied:
+                return 0
+            journal.append_many(applied)
+            self._remember_signature(journal)
+            self._maybe_compact(journal)
+            return len(applied)
+
+    def rename_preacher(self, preacher_id: int):
+        # У пам'яті записи тримають id, тож нове ім'я вже видно скрізь;
+        # на диску переписуємо знімок одним проходом.
+        with self._lock:
+            self._refresh()
+            self._bump_all()
+            self._maybe_compact(self._schedule_journal, force=True)
+
+    def merge_preacher(self, source_id: int, target_id: int):
+        with self._lock:
+            self._refresh()
+            index = self._preacher_index.get(source_id)
+            for day in index.between() if index else []:
+                before = self._schedule[day]
+                ids = tuple(dict.fromkeys(
+                    target_id if preacher_id == source_id else preacher_id
+                    for preacher_id in before.preacher_ids
+                ))
+                self._schedule[day] = ScheduleEntry(day, ids)
+                self._reindex_preachers(day, before, self._schedule[day])
+            self._bump_all()
+            # Журнал зі старим написанням і так читається як target (через
+            # псевдонім), але знімок переписуємо, щоб на диску лишилось одне ім'я
+            self._maybe_compact(self._schedule_journal, force=True)
+
+    def _remember_signature(self, journal: Journal):
+        """Запам'ятовує стан файлів після власної зміни, щоб _refresh їх не перечитував."""
+        if journal is self._schedule_journal:
+            self._schedule_sig = journal.signature()
+        else:
+            self._events_sig = journal.signature()
+
+    def _maybe_compact(self, journal: Journal, force: bool = False):
+        if journal in self._compacting:
+            return
+        if not force and journal.size() < JOURNAL_COMPACT_BYTES:
+            return
+        self._compacting.add(journal)
+        journal.rotate()
+        self._remember_signature(journal)
+        if journal is self._schedule_journal:
+            lines = [
+                f"{entry.date_str}|{','.join(entry.preachers)}"
+                for entry in self._schedule.values()
+            ]
+        else:
+            lines = [
+                f"{event.date_str}|{event.title}"
+                for day_events in self._events.values()
+                for event in day_events
+            ]
+        threading.Thread(target=self._compact, args=(journal, lines), daemon=True).start()
+
+    def _compact(self, journal: Journal, lines: list):
+        # Знімок пишеться без замка, а заміна знімка і видалення *.old — під
+        # ним: інакше _refresh міг би прочитати старий знімок, не знайти вже
+        # видаленого *.old і втратити відкладені записи
+        try:
+            tmp_path = journal.write_snapshot(lines)
+            with self._lock:
+                journal.install_snapshot(tmp_path)
+        except OSError as e:
+            # Журнал *.old лишається на диску і буде застосований при читанні
+            print(f"Помилка ущільнення журналу {journal.path}: {e}")
+        finally:
+            with self._lock:
+                self._compacting.discard(journal)
+                self._remember_signature(journal)
+
+    def add_preacher(self, date: str, preacher: str):
+        self._op(self._schedule_journal, "+", date, preacher)
+
+    def add_preachers(self, assignments: list) -> int:
+        return self._ops(
+            self._schedule_journal,
+            [("+", date, preacher) for date, preacher in assignments],
+        )
+
+    def delete_date(self, date: str) -> bool:
+        return self._op(self._schedule_journal, "x", date)
+
+    def delete_preacher(self, date: str, preacher: str) -> bool:
+        return self._op(self._schedule_journal, "-", date, preacher)
+
+    def add_event(self, date: str, title: str):
+        self._op(self._events_journal, "+", date, title.replace("\n", " "))
+
+    def delete_event(self, date: str, title: str) -> bool:
+        return self._op(self._events_journal, "-", date, title)
+
+class SqliteStore(ScheduleStore):
+    """
+    Сховище в SQLite (режим WAL). Дата зберігається як порядковий номер дня,
+    є індекси за датою і за проповідником, тож вибірка за місяць чи вікно
+    нагадувань — це запит по індексу, а не перебір усіх рядків.
+    """
+
+    def __init__(self, db_file: str):
+        super().__init__()
+        self.db_file = db_file
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Нормалізоване ім'я (як у реєстрі) — щоб знаходити будь-яке написання
+        self._conn.create_function("preacher_key", 1, Roster._key, deterministic=True)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sermons (
+                day INTEGER NOT NULL,
+                preacher TEXT NOT NULL,
+                PRIMARY KEY (day, preacher)
+            );
+            CREATE INDEX IF NOT EXISTS sermons_preacher ON sermons (preacher, day);
+            CREATE TABLE IF NOT EXISTS events (
+                day INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                PRIMARY KEY (day, title)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._canonicalize_names()
+
+    @staticmethod
+    def _day(date_str: str) -> int:
+        return parse_date(date_str).toordinal()
+
+    @staticmethod
+    def _canonical(name: str) -> str:
+        """Ім'я з реєстру для будь-якого написання (як у TextStore через id)."""
+        return roster.name_of(roster.id_of(name))
+
+    def _canonicalize_names(self):
+        """
+        Один раз переписує рядки, збережені псевдонімом чи іншим регістром
+        до того, як записи почали приводитись до імені з реєстру.
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'canonical_names'").fetchone():
+                return
+            names = [name for (name,) in self._conn.execute("SELECT DISTINCT preacher FROM sermons")]
+            with self._conn:
+                self._conn.execute("BEGIN")
+                for name in names:
+                    canonical = self._canonical(name)
+                    if canonical != name:
+                        self._conn.execute(
+                            "UPDATE OR IGNORE sermons SET preacher = ? WHERE preacher = ?",
+                            (canonical, name),
+                        )
+                        self._conn.execute("DELETE FROM sermons WHERE preacher = ?", (name,))
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('canonical_names', '1')")
+
+    @staticmethod
+    def _range(start, end):
+        return (
+            start.toordinal() if start else 0,
+            end.toordinal() if end else date.max.toordinal(),
+        )
+
+    def _query(self, sql: str, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        metrics.inc("bot_storage_rows_total", len(rows), direction="read")
+        return rows
+
+    def _mutate(self, sql: str, day: int, *params) -> bool:
+        """Виконує зміну для дня; True, якщо якийсь рядок змінився."""
+        with self._lock:
+            changed = self._conn.execute(sql, (day, *params)).rowcount
+            if changed:
+                self._bump(day)
+                metrics.inc("bot_storage_rows_total", changed, direction="write")
+            return changed > 0
+
+    def migrate_from_text(self, schedule_file: str, events_file: str) -> bool:
+        """
+        Одноразово переносить дані з txt файлів (разом із журналами).
+        Повертає True, якщо перенесення відбулося.
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                return False
+            text_store = TextStore(schedule_file, events_file)
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO sermons (day, preacher) VALUES (?, ?)",
+                    [
+                        (entry.day, preacher)
+                        for entry in text_store.schedule_between()
+                        for preacher in entry.preachers
+                    ],
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO events (day, title) VALUES (?, ?)",
+                    [(event.day, event.title) for event in text_store.events_between()],
+                )
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('migrated', ?)",
+                    (datetime.now().isoformat(),),
+                )
+            return True
+
+    def preachers_on(self, date_str: str) -> list:
+        rows = self._query(
+            "SELECT preacher FROM sermons WHERE day = ? ORDER BY rowid", (self._day(date_str),)
+        )
+        return [preacher for (preacher,) in rows]
+
+    def has_schedule(self) -> bool:
+        return bool(self._query("SELECT 1 FROM sermons LIMIT 1"))
+
+    def schedule_between(self, start=None, end=None) -> list:
+        rows = self._query(
+            "SELECT day, preacher FROM sermons WHERE day BETWEEN ? AND ? ORDER BY day, rowid",
+            self._range(start, end),
+        )
+        result = []
+        for day, preacher in rows:
+            preacher_id = roster.id_of(preacher)
+            if result and result[-1].day == day:
+                result[-1].preacher_ids += (preacher_id,)
+            else:
+                result.append(ScheduleEntry(day, (preacher_id,)))
+        return result
+
+    def events_between(self, start=None, end=None) -> list:
+        rows = self._query(
+            "SELECT day, title FROM events WHERE day BETWEEN ? AND ? ORDER BY day, rowid",
+            self._range(start, end),
+        )
+        return [Event(day, title) for day, title in rows]
+
+    def _days(self, table: str, start, end, limit, reverse) -> list:
+        rows = self._query(
+            f"SELECT DISTINCT day FROM {table} WHERE day BETWEEN ? AND ? "
+            f"ORDER BY day {'DESC' if reverse else 'ASC'} LIMIT ?",
+            (*self._range(start, end), -1 if limit is None else limit),
+        )
+        return [day for (day,) in rows]
+
+    def schedule_days(self, start=None, end=None, limit=None, reverse=False) -> list:
+        return self._days("sermons", start, end, limit, reverse)
+
+    def event_days(self, start=None, end=None, limit=None, reverse=False) -> list:
+        return self._days("events", start, end, limit, reverse)
+
+    def preacher_days(self, preacher_id: int, start=None, end=None,
+                      limit=None, reverse=False) -> list:
+        spellings = roster.spellings(preacher_id)
+        placeholders = ",".join("?" * len(spellings))
+        rows = self._query(
+            f"SELECT day FROM sermons WHERE preacher IN ({placeholders}) AND day BETWEEN ? AND ? "
+            f"ORDER BY day {'DESC' if reverse else 'ASC'} LIMIT ?",
+            (*spellings, *self._range(start, end), -1 if limit is None else limit),
+        )
+        return [day for (day,) in rows]
+
+    def add_preacher(self, date: str, preacher: str):
+        day = self._day(date)
+        preacher = self._canonical(preacher)
+        with self._lock:
+            if self._mutate(
+                "INSERT OR IGNORE INTO sermons (day, preacher) VALUES (?, ?)", day, preacher
+            ):
+                self._count(roster.id_of(preacher), day, 1)
+
+    def add_preachers(self, assignments: list) -> int:
+        added = 0
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                for date, preacher in assignments:
+                    day = self._day(date)
+                    preacher = self._canonical(preacher)
+                    if self._conn.execute(
+                        "INSERT OR IGNORE INTO sermons (day, preacher) VALUES (?, ?)",
+                        (day, preacher),
+                    ).rowcount:
+                        self._bump(day)
+                        self._count(roster.id_of(preacher), day, 1)
+                        added += 1
+        metrics.inc("bot_storage_rows_total", added, direction="write")
+        return added
+
+    def delete_date(self, date: str) -> bool:
+        day = self._day(date)
+        with self._lock:
+            preachers = self._query("SELECT preacher FROM sermons WHERE day = ?", (day,))
+            if not self._mutate("DELETE FROM sermons WHERE day = ?", day):
+                return False
+            for (preacher,) in preachers:
+                self._count(roster.id_of(preacher), day, -1)
+            return True
+
+    def delete_preacher(self, date: str, preacher: str) -> bool:
+        day = self._day(date)
+        preacher_id = roster.find(preacher)
+        if preacher_id is None:
+            return False
+        with self._lock:
+            if not self._mutate(
+                "DELETE FROM sermons WHERE day = ? AND preacher = ?", day, roster.name_of(preacher_id)
+            ):
+                return False
+            self._count(preacher_id, day, -1)
+            return True
+
+    def rename_preacher(self, preacher_id: int):
+        # Рядки шукаються за нормалізованим ім'ям, а не за точним текстом:
+        # попереднє написання, що відрізнялось лише крапками чи регістром,
+        # не стає псевдонімом, але його рядки теж треба переписати
+        new_name = roster.name_of(preacher_id)
+        keys = sorted({Roster._key(name) for name in roster.spellings(preacher_id)})
+        placeholders = ",".join("?" * len(keys))
+        match = f"preacher != ? AND preacher_key(preacher) IN ({placeholders})"
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute(
+                    f"UPDATE OR IGNORE sermons SET preacher = ? WHERE {match}",
+                    (new_name, new_name, *keys),
+                )
+                # Якщо на ту саму дату вже був запис з новим ім'ям — старий зайвий
+                self._conn.execute(f"DELETE FROM sermons WHERE {match}", (new_name, *keys))
+            # Дублікати на одну дату могли зникнути — статистику перебудуємо при потребі
+            self._stats = None
+            self._bump_all()
+
+    def merge_preacher(self, source_id: int, target_id: int):
+        # Написання source вже стали псевдонімами target — це те саме перейменування
+        self.rename_preacher(target_id)
+
+    def add_event(self, date: str, title: str):
+        self._mutate(
+            "INSERT OR IGNORE INTO events (day, title) VALUES (?, ?)",
+            self._day(date), title.replace("\n", " "),
+        )
+
+    def delete_event(self, date: str, title: str) -> bool:
+        return self._mutate(
+            "DELETE FROM events WHERE day = ? AND title = ?", self._day(date), title
+        )
+
+def create_store() -> ScheduleStore:
+    """Сховище за змінною STORAGE_BACKEND: "text" (за замовчуванням) або "sqlite"."""
+    if STORAGE_BACKEND == "sqlite":
+        sqlite_store = SqliteStore(SQLITE_FILE)
+        if sqlite_store.migrate_from_text(SCHEDULE_FILE, EVENTS_FILE):
+            print(f"Дані з {SCHEDULE_FILE} і {EVENTS_FILE} перенесено в {SQLITE_FILE}.")
+        return sqlite_store
+    return TextStore(SCHEDULE_FILE, EVENTS_FILE)
+
+store = create_store()
 
 def save_event(date: str, title: str):
-    """Збереження події в txt файл."""
-    with open(EVENTS_FILE, "a", encoding="utf-8") as f:
-        f.write(f"{date}|{title}\n")
+    """Збереження події в сховище."""
+    store.add_event(date, title)
 
 def delete_event(date: str, title: str) -> bool:
-    """Видалення події з txt файлу."""
-    events = load_events()
-    new_events = [e for e in events if not (e["date"] == date and e["title"] == title)]
-    if len(new_events) == len(events):
-        return False
-    with open(EVENTS_FILE, "w", encoding="utf-8") as f:
-        for e in new_events:
-            f.write(f"{e['date']}|{e['title']}\n")
-    return True
+    """Видалення події зі сховища."""
+    return store.delete_event(date, title)
 
 def save_schedule(new_entry):
-    """Додавання нового запису до txt файлу."""
-    schedule = load_schedule()
+    """Додавання нового запису до сховища."""
     for date, preacher in new_entry.items():
-        if date in schedule:
-            if preacher not in schedule[date]:
-                schedule[date].append(preacher)
-        else:
-            schedule[date] = [preacher]
-    save_schedule_to_file(schedule)
+        store.add_preacher(date, preacher)
 
-async def export_table_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+class AsyncStore:
     """
-    Команда /export [current|next]
-    Створює Word-документ з таблицею проповідників тільки за обраний місяць:
-    - /export_table current => поточний місяць
-    - /export_table next    => наступний місяць
-    Якщо не передано аргумент, використовується поточний місяць.
+    Доступ до сховища з обробників. Кожна операція виконується в потоці
+    (asyncio.to_thread), тож файловий чи SQLite ввід-вивід не блокує цикл
+    подій і оновлення можуть оброблятися паралельно (concurrent_updates).
+    Зміни одного ресурсу ("schedule", "events", "roster") йдуть по черзі під
+    своїм asyncio.Lock, а run() дозволяє виконати під тим самим замком
+    кілька кроків (перевірити і записати) як одну операцію. Читання замка
+    не чекають: саме сховище тримає узгоджений стан під власним замком.
     """
-    if not is_admin_chat(update):
-        return
-    user_input = update.message.text.strip().split()
-    chosen_option = None
-    if len(user_input) > 1:
-        chosen_option = user_input[1].lower()  # "current" або "next"
 
-    # Визначаємо, який місяць фільтрувати
-    now = datetime.now()
-    this_year = now.year
-    this_month = now.month
-
-    if chosen_option == "next":
-        # Наступний місяць
-        if this_month == 12:
-            filter_year = this_year + 1
-            filter_month = 1
-        else:
-            filter_year = this_year
-            filter_month = this_month + 1
-    else:
-        # За замовчуванням - поточний місяць
-        filter_year = this_year
-        filter_month = this_month
+    # метод сховища -> ресурс, чий замок потрібен для зміни
+    RESOURCES = {
+        "add_preacher": "schedule",
+        "add_preachers": "schedule",
+        "delete_date": "schedule",
+        "delete_preacher": "schedule",
+        "rename_preacher": "schedule",
+        "merge_preacher": "schedule",
+        "verify_stats": "schedule",
+        "add_event": "events",
+        "delete_event": "events",
+    }
 
-    # -------------------------------------------------
-    # 1) Завантажуємо розклад з БД
-    # -------------------------------------------------
-    schedule = load_schedule()  
-    if not schedule:
-        await update.message.reply_text("Розклад порожній, немає що експортувати.")
-        return
+    def __init__(self, store: ScheduleStore):
+        self.store = store
+        self._locks = {}
+
+    def lock(self, resource: str) -> asyncio.Lock:
+        lock = self._locks.get(resource)
+        if lock is None:
+            lock = self._locks[resource] = asyncio.Lock()
+        return lock
+
+    async def run(self, resource, func, *args, **kwargs):
+        """func(*args) у потоці; якщо задано resource — під його замком."""
+        started = time_module.perf_counter()
+        try:
+            if resource is None:
+                return await asyncio.to_thread(func, *args, **kwargs)
+            async with self.lock(resource):
+                return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            metrics.observe(
+                "bot_storage_seconds", time_module.perf_counter() - started,
+                op=func.__name__, resource=resource or "read",
+            )
 
-    # Усі дати, відсортовані
-    all_dates_str = sorted(schedule.keys(), key=lambda d: datetime.strptime(d, "%d.%m.%Y"))
-    if not all_dates_str:
-        await update.message.reply_text("Немає дат у розкладі.")
-        return
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+        resource = self.RESOURCES.get(name)
 
-    # -------------------------------------------------
-    # 2) Фільтруємо лише ті дати, які припадають на обраний місяць/рік
-    # -------------------------------------------------
-    filtered_dates = []
-    for date_str in all_dates_str:
-        dt = datetime.strptime(date_str, "%d.%m.%Y")
-        if dt.year == filter_year and dt.month == filter_month:
-            filtered_dates.append(date_str)
-
-    if not filtered_dates:
-        # Якщо немає дат за обраний місяць
-        month_name = f"{filter_month:02d}.{filter_year}"
-        await update.message.reply_text(
-            f"Немає жодної дати для місяця {month_name} у розкладі."
-        )
-        return
+        async def call(*args, **kwargs):
+            return await self.run(resource, method, *args, **kwargs)
+        return call
+
+astore = AsyncStore(store)
+
+EXPORT_CACHE_SIZE = int(os.getenv("EXPORT_CACHE_SIZE", "16"))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "64"))
+
+class ExportCache:
+    """
+    LRU-кеш готових файлів експорту за ключем (рік, місяць, ревізія, формат).
+    Після першого надсилання запам'ятовується file_id від Telegram, і
+    повторний експорт того ж місяця без змін не завантажує файл знову.
+    Після редагування місяця змінюється його ревізія, тож старий запис
+    просто перестає використовуватись і згодом витісняється.
+    """
 
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """{"data": bytes, "file_id": str|None} або None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, data: bytes) -> dict:
+        entry = {"data": data, "file_id": None}
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+export_cache = ExportCache(EXPORT_CACHE_SIZE)
+
+class RenderCache:
+    """
+    LRU-кеш готових текстів (сторінки /show і /show_events, тексти нагадувань)
+    за ключем (вид, сторінка, ревізія сховища). Поки даних не редагували,
+    повторний перегляд не звертається до сховища і нічого не форматує;
+    після зміни ревізія інша, і старі записи згодом витісняються.
+    Лічильники hits/misses — для метрик бота.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """Значення з кешу або результат render(), збережений під key."""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        # Рендер — поза замком: сторінки рахуються в кількох потоках паралельно
+        value = render()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+metrics.describe("bot_render_cache_hits_total", "counter", "Попадання в кеш сторінок і нагадувань")
+metrics.describe("bot_render_cache_misses_total", "counter", "Промахи кешу сторінок і нагадувань")
+metrics.describe("bot_conversations", "gauge", "Незавершені діалоги")
+
+@metrics.collector
+def collect_state_metrics(registry: Metrics):
+    registry.set("bot_render_cache_hits_total", render_cache.hits)
+    registry.set("bot_render_cache_misses_total", render_cache.misses)
+    registry.set("bot_conversations", len(user_states))
+
+def _cell_xml(text: str, width: int, fill=None) -> str:
+    """XML однієї клітинки <w:tc>; перенос рядка у тексті стає <w:br/>."""
+    shd = f'<w:shd w:fill="{fill}"/>' if fill else ""
+    if text:
+        parts = []
+        for line in text.split("\n"):
+            space = ' xml:space="preserve"' if line != line.strip() else ""
+            parts.append(f"<w:t{space}>{xml_escape(line)}</w:t>")
+        paragraph = f"<w:p><w:r>{'<w:br/>'.join(parts)}</w:r></w:p>"
+    else:
+        paragraph = "<w:p/>"
+    return f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/>{shd}</w:tcPr>{paragraph}</w:tc>'
+
+def render_table(doc, header: list, row_titles: list, fills: list, style: str):
+    """
+    Додає в документ таблицю за один прохід: XML усіх рядків і клітинок
+    збирається одним рядком і розбирається один раз, без table.cell() і
+    окремих w:shd елементів на кожну клітинку.
+    header — тексти першого рядка; row_titles — перший стовпець;
+    fills[рядок][стовпець] — колір заливки клітинки або None.
+    Результат такий самий, як у doc.add_table() із заповненням по клітинках.
+    """
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls
+    from docx.shared import Emu
+
+    cols_count = len(header)
+    col_width = int(Emu(doc._block_width // cols_count).twips) if cols_count else 0
+    style_id = doc.styles[style].style_id
+
+    rows_xml = ["<w:tr>" + "".join(_cell_xml(text, col_width) for text in header) + "</w:tr>"]
+    for title, row_fills in zip(row_titles, fills):
+        cells = [_cell_xml(title, col_width)]
+        cells.extend(_cell_xml("", col_width, fill) for fill in row_fills)
+        rows_xml.append("<w:tr>" + "".join(cells) + "</w:tr>")
+
+    grid_xml = f'<w:gridCol w:w="{col_width}"/>' * cols_count
+    tbl = parse_xml(
+        f"<w:tbl {nsdecls('w')}>"
+        f"<w:tblPr>"
+        f'<w:tblStyle w:val="{style_id}"/>'
+        f'<w:tblW w:type="auto" w:w="0"/>'
+        f'<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0"'
+        f' w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+        f"</w:tblPr>"
+        f"<w:tblGrid>{grid_xml}</w:tblGrid>"
+        f"{''.join(rows_xml)}"
+        f"</w:tbl>"
+    )
+    doc.element.body._insert_tbl(tbl)
+
+def build_schedule_docx(months: list, fileobj):
+    """
+    Записує у fileobj Word-документ: для кожного місяця заголовок і таблиця
+    проповідників. months — список (рік, місяць, [ScheduleEntry]).
+    Синхронна і без спільного стану на диску — викликається з пулу потоків,
+    щоб не блокувати цикл подій бота.
+    """
     # -------------------------------------------------
-    # 3) Cписок проповідників (може бути ваш PREACHERS = [...])
+    # 1) Cписок проповідників: активні з реєстру, плюс неактивні,
+    #    якщо вони записані на якусь із дат
     # -------------------------------------------------
-    preachers = [
-        "Босько П.", "Біленко Ю.", "Мосійчук В.", "Мироненко І.",
-        "Барановський М.", "Пономарьов А.", "Замуруєв В.", "Григоров А.",
-        "Савостін В.", "Козак Є.", "Кулик Є.", "Ковальчук Ю.",
-        "Савостін І.", "Суржа П.", "Волос В"
-    ]
+    preacher_ids = roster.active_ids()
+    listed = set(preacher_ids)
+    for _, _, entries in months:
+        for entry in entries:
+            for preacher_id in entry.preacher_ids:
+                if preacher_id not in listed:
+                    listed.add(preacher_id)
+                    preacher_ids.append(preacher_id)
+    preachers = [roster.name_of(preacher_id) for preacher_id in preacher_ids]
+    short_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Нд"]
 
     # -------------------------------------------------
-    # 4) Створюємо документ Word
+    # 2) Створюємо документ Word
     # -------------------------------------------------
+    import docx  # python-docx
+
     doc = docx.Document()
 
-    # Щоб у підписі було зрозуміло, за який місяць генеруємо
-    doc.add_heading(
-        f"Розклад проповідей за {filter_month:02d}.{filter_year}",
-        level=1
+    for filter_year, filter_month, entries in months:
+        # Щоб у підписі було зрозуміло, за який місяць генеруємо
+        doc.add_heading(
+            f"Розклад проповідей за {filter_month:02d}.{filter_year}",
+            level=1
+        )
+
+        # -------------------------------------------------
+        # 2.1) Матриця "проповідник × дата": колір клітинки або None
+        # -------------------------------------------------
+        # четвер => жовтий, неділя => червоний, інші дні — сірий
+        column_fills = [
+            {3: "FFFF00", 6: "FF0000"}.get(entry.weekday, "DDDDDD") for entry in entries
+        ]
+        column_members = [set(entry.preacher_ids) for entry in entries]
+        matrix = [
+            [
+                fill if preacher_id in members else None
+                for fill, members in zip(column_fills, column_members)
+            ]
+            for preacher_id in preacher_ids
+        ]
+
+        # -------------------------------------------------
+        # 2.2) Таблиця: шапка (дата + день тижня) і рядки проповідників
+        # -------------------------------------------------
+        header = ["Проповідники"] + [
+            f"{entry.date_str}\n({short_days[entry.weekday]})" for entry in entries
+        ]
+        render_table(doc, header, preachers, matrix, style="Table Grid")
+
+    doc.save(fileobj)
+
+def iter_schedule(months: list):
+    """Записи розкладу місяць за місяцем — в пам'яті лише один місяць."""
+    for year, month in months:
+        yield from store.schedule_for_month(year, month)
+
+def iter_events(months: list):
+    """Події місяць за місяцем — так само по одному місяцю в пам'яті."""
+    for year, month in months:
+        yield from store.events_between(*month_bounds(year, month))
+
+def schedule_rows(months: list):
+    """Рядки таблиці експорту: шапка, далі (дата, день тижня, проповідники)."""
+    yield ["Дата", "День", "Проповідники"]
+    for entry in iter_schedule(months):
+        yield [entry.date_str, SHORT_DAYS_OF_WEEK[entry.weekday], ", ".join(entry.preachers)]
+
+def write_csv(months: list, fileobj) -> int:
+    """CSV (UTF-8 з BOM, щоб Excel правильно показав кирилицю). Повертає кількість записів."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    count = -1
+    for row in schedule_rows(months):
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+_XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Розклад" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+def write_xlsx(months: list, fileobj) -> int:
+    """
+    Мінімальна книга Excel з одним аркушем; аркуш пишеться в zip потоково,
+    рядок за рядком (рядки як inline-тексти). Повертає кількість записів.
+    """
+    count = -1
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            zf.writestr(name, content)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            for row in schedule_rows(months):
+                cells = "".join(
+                    f'<c t="inlineStr"><is><t>{xml_escape(value)}</t></is></c>' for value in row
+                )
+                sheet.write(f"<row>{cells}</row>".encode("utf-8"))
+                count += 1
+            sheet.write(b"</sheetData></worksheet>")
+    return count
+
+def _ics_escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
     )
 
-    # Кількість рядків: 1 (шапка з датами) + кількість проповідників
-    # Кількість колонок: 1 (список проповідників) + кількість дат
-    rows_count = 1 + len(preachers)
-    cols_count = 1 + len(filtered_dates)
+def _ics_fold(line: str) -> str:
+    """Переносить рядок iCalendar по 75 байт (RFC 5545, 3.1)."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts = []
+    limit = 75
+    while data:
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1  # не розрізаємо UTF-8 символ
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+        limit = 74  # наступні рядки починаються з пробілу
+    return "\r\n ".join(parts) + "\r\n"
+
+def _ics_event(uid: str, day: int, summary: str, stamp: str) -> list:
+    start = date.fromordinal(day)
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@bot-church-reminder",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{start:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{_ics_escape(summary)}",
+        "END:VEVENT",
+    ]
 
-    table = doc.add_table(rows=rows_count, cols=cols_count)
-    table.style = "Table Grid"
+def ics_lines(months: list):
+    """Календар iCalendar з проповідями і подіями, рядок за рядком."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//bot-church-reminder//UK",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:Розклад проповідей",
+    ]
+    for line in header:
+        yield _ics_fold(line)
+    # Порядок VEVENT у календарі не важливий: спершу проповіді, потім події
+    for entry in iter_schedule(months):
+        for line in _ics_event(
+            f"sermon-{entry.day}", entry.day, f"Проповідь: {', '.join(entry.preachers)}", stamp
+        ):
+            yield _ics_fold(line)
+    for event in iter_events(months):
+        uid = f"event-{event.day}-{zlib.crc32(event.title.encode('utf-8')):08x}"
+        for line in _ics_event(uid, event.day, event.title, stamp):
+            yield _ics_fold(line)
+    yield _ics_fold("END:VCALENDAR")
+
+def write_ics(months: list, fileobj) -> int:
+    count = 0
+    for line in ics_lines(months):
+        fileobj.write(line.encode("utf-8"))
+        count += line.startswith("BEGIN:VEVENT")
+    return count
+
+EXPORT_FORMATS = ("docx", "csv", "xlsx", "ics")
+EXPORT_MAX_MONTHS = 120
+# Більші файли не кешуються в пам'яті
+EXPORT_CACHE_MAX_BYTES = 1024 * 1024
+
+def render_export(fmt: str, months: list):
+    """
+    Будує файл експорту у тимчасовому файлі (у пам'яті лише до 1 МБ).
+    Повертає файл, перемотаний на початок, або None, якщо експортувати нічого.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_CACHE_MAX_BYTES)
+    if fmt == "docx":
+        month_entries = []
+        for year, month in months:
+            entries = store.schedule_for_month(year, month)
+            if entries:
+                month_entries.append((year, month, entries))
+        count = len(month_entries)
+        if count:
+            build_schedule_docx(month_entries, spool)
+    else:
+        writer = {"csv": write_csv, "xlsx": write_xlsx, "ics": write_ics}[fmt]
+        count = writer(months, spool)
+    if not count:
+        spool.close()
+        return None
+    spool.seek(0)
+    return spool
+
+def parse_export_month(text: str, now: datetime) -> tuple:
+    """(рік, місяць) з "current", "next" або "ММ.РРРР" (ValueError при помилці)."""
+    if text == "current":
+        return now.year, now.month
+    if text == "next":
+        return (now.year + 1, 1) if now.month == 12 else (now.year, now.month + 1)
+    parsed = datetime.strptime(text, "%m.%Y")
+    return parsed.year, parsed.month
+
+def shift_month(month: tuple, delta: int) -> tuple:
+    """(рік, місяць), зсунутий на delta місяців."""
+    index = month[0] * 12 + month[1] - 1 + delta
+    return index // 12, index % 12 + 1
+
+def months_between(start: tuple, end: tuple) -> list:
+    """Усі (рік, місяць) від start до end включно."""
+    first = start[0] * 12 + start[1] - 1
+    last = end[0] * 12 + end[1] - 1
+    return [(index // 12, index % 12 + 1) for index in range(first, last + 1)]
+
+EXPORT_USAGE = (
+    "Використання: /export [current|next|ММ.РРРР [ММ.РРРР]] [docx|csv|xlsx|ics]\n"
+    "Наприклад: /export next, /export 01.2026 12.2026 csv"
+)
+
+def month_revisions(months: list) -> tuple:
+    """Ревізії місяців для ключа кешу експорту (змінені на диску файли перечитуються)."""
+    return tuple(store.month_revision(year, month) for year, month in months)
 
-    # -------------------------------------------------
-    # 4.1) Заповнюємо верхній рядок (дата + день тижня)
-    # -------------------------------------------------
-    table.cell(0, 0).text = "Проповідники"
+async def export_table_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Команда /export [current|next|ММ.РРРР [ММ.РРРР]] [docx|csv|xlsx|ics]
+    Експортує розклад за місяць або діапазон місяців:
+    - /export current => поточний місяць (Word)
+    - /export next    => наступний місяць
+    - /export 01.2026 12.2026 csv => рік 2026 у CSV
+    docx — таблиця проповідників по місяцях; csv/xlsx — список дат;
+    ics — календар з проповідями та подіями для підписки.
+    Якщо не передано аргумент, використовується поточний місяць у Word.
+    """
+    if not is_admin_chat(update):
+        return
+    args = [arg.lower() for arg in update.message.text.strip().split()[1:]]
+    fmt = "docx"
+    if args and args[-1] in EXPORT_FORMATS:
+        fmt = args.pop()
 
-    short_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Нд"]
-    for col_idx, date_str in enumerate(filtered_dates, start=1):
-        dt = datetime.strptime(date_str, "%d.%m.%Y")
-        weekday_num = dt.weekday()  # 0=Пн ... 6=Нд
-        day_of_week_str = short_days[weekday_num]
-        cell = table.cell(0, col_idx)
-        cell.text = f"{date_str}\n({day_of_week_str})"
+    # Визначаємо, які місяці експортувати
+    now = datetime.now()
+    try:
+        if len(args) > 2:
+            raise ValueError("забагато аргументів")
+        start = parse_export_month(args[0], now) if args else (now.year, now.month)
+        end = parse_export_month(args[1], now) if len(args) > 1 else start
+    except ValueError:
+        await update.message.reply_text(EXPORT_USAGE)
+        return
+    months = months_between(start, end)
+    if not months or len(months) > EXPORT_MAX_MONTHS:
+        await update.message.reply_text(
+            f"Діапазон має бути від 1 до {EXPORT_MAX_MONTHS} місяців.\n{EXPORT_USAGE}"
+        )
+        return
 
     # -------------------------------------------------
-    # 4.2) Заповнюємо перший стовпець проповідниками
+    # 1) Перевіряємо, що розклад не порожній
     # -------------------------------------------------
-    for row_idx, preacher in enumerate(preachers, start=1):
-        table.cell(row_idx, 0).text = preacher
+    if fmt != "ics" and not await astore.has_schedule():
+        await update.message.reply_text("Розклад порожній, немає що експортувати.")
+        return
+
+    if start == end:
+        period = f"{start[1]:02d}.{start[0]}"
+        filename = "графік." + fmt
+    else:
+        period = f"{start[1]:02d}.{start[0]}–{end[1]:02d}.{end[0]}"
+        filename = f"графік_{start[1]:02d}.{start[0]}-{end[1]:02d}.{end[0]}.{fmt}"
 
     # -------------------------------------------------
-    # 4.3) Фарбуємо клітинки, якщо проповідник записаний на дату
+    # 2) Беремо файл з кешу або будуємо у пулі потоків
     # -------------------------------------------------
-    for col_idx, date_str in enumerate(filtered_dates, start=1):
-        dt = datetime.strptime(date_str, "%d.%m.%Y")
-        weekday_num = dt.weekday()
-
-        for row_idx, preacher in enumerate(preachers, start=1):
-            if date_str in schedule and preacher in schedule[date_str]:
-                cell = table.cell(row_idx, col_idx)
-                if weekday_num == 3:
-                    # четвер => жовтий
-                    set_cell_bg_color(cell, "FFFF00")
-                elif weekday_num == 6:
-                    # неділя => червоний
-                    set_cell_bg_color(cell, "FF0000")
-                else:
-                    # Інші дні тижня — сірий (на бажання)
-                    set_cell_bg_color(cell, "DDDDDD")
+    revisions = await astore.run(None, month_revisions, months)
+    cache_key = (start, end, revisions, fmt)
+    cached = export_cache.get(cache_key)
+    spool = None
+    if cached is None:
+        spool = await asyncio.to_thread(render_export, fmt, months)
+        if spool is None:
+            await update.message.reply_text(
+                f"Немає жодної дати для місяця {period} у розкладі."
+                if start == end else f"Немає жодної дати за {period} у розкладі."
+            )
+            return
+        size = spool.seek(0, io.SEEK_END)
+        spool.seek(0)
+        if size <= EXPORT_CACHE_MAX_BYTES:
+            cached = export_cache.put(cache_key, spool.read())
+            spool.close()
+            spool = None
 
     # -------------------------------------------------
-    # 5) Зберігаємо та надсилаємо файл
+    # 3) Надсилаємо: повторно — за file_id, без нового завантаження
     # -------------------------------------------------
-    filename = "графік.docx"
-    doc.save(filename)
-
-    with open(filename, "rb") as f:
-        await context.bot.send_document(
+    caption = f"Розклад проповідей за {period}."
+    if fmt == "docx":
+        caption = (
+            f"Таблиця з розкладом проповідей за {period}. "
+            "Жовтий - четвер, червоний - неділя."
+        )
+    try:
+        message = await context.bot.send_document(
             chat_id=update.effective_chat.id,
-            document=f,
+            document=spool if spool is not None else cached["file_id"] or cached["data"],
             filename=filename,
-            caption=(
-                f"Таблиця з розкладом проповідей за {filter_month:02d}.{filter_year}. "
-                "Жовтий - четвер, червоний - неділя."
-            )
+            caption=caption
         )
-
-# Список проповідників
-PREACHERS = [
-    "Басько П.", "Біленко Ю.", "Мосійчук В.", "Мироненко І.",
-    "Барановський М.", "Пономарьов А.", "Замуруєв В.", "Григоров А.",
-    "Савостін В.", "Козак Є.", "Кулик Є.", "Ковальчук Ю.",
-    "Савостін І.", "Суржа П.", "Кітченко Я.", "Волос В.",
-    "Сардак Р."
-]
+    finally:
+        if spool is not None:
+            spool.close()
+    if cached is not None and message.document is not None:
+        cached["file_id"] = message.document.file_id
 
 # Мапа скорочень днів тижня
 SHORT_DAYS_OF_WEEK = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Нд"]
@@ -286,11 +2287,18 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Почати спілкування з ботом
 /add - Додати нову проповідь
 /show - Показати розклад проповідей
-/export - Експортувати розклад в файл
+/export - Експортувати розклад в файл (місяць або діапазон; docx, csv, xlsx, ics)
 /delete - Видалити проповідь
 /add_event - Додати церковну подію
 /show_events - Показати заплановані події
 /delete_event - Видалити подію
+/preachers - Список проповідників і керування ним
+/find - Коли проповідує проповідник (за початком імені)
+/free - Хто вільний на дату
+/stats - Статистика проповідей за період
+/autoplan - Автоматичний план на вільні четверги й неділі
+/blackout - Періоди недоступності проповідників
+/metrics - Метрики роботи бота
 /help - Показати список доступних команд
 """
     await update.message.reply_text(commands)
@@ -353,7 +2361,7 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [[KeyboardButton(date_str)] for date_str in all_dates]
 
     # Записуємо стан користувача
-    user_states[update.effective_user.id] = "waiting_for_date"
+    start_step(update.effective_user.id, "waiting_for_date")
 
     # Виводимо повідомлення з вибором дати
     await update.message.reply_text(
@@ -367,274 +2375,913 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def delete_schedule_date(date_str: str) -> bool:
     """Видаляє цілу дату (з усіма проповідниками) з txt файлу."""
-    schedule = load_schedule()
-    if date_str not in schedule:
-        return False
-    del schedule[date_str]
-    save_schedule_to_file(schedule)
-    return True
+    return store.delete_date(date_str)
 
 def delete_schedule_preacher(date_str: str, preacher: str) -> bool:
     """
     Видаляє вказаного проповідника з конкретної дати.
     Якщо після видалення проповідників не лишається — видаляє дату.
     """
-    schedule = load_schedule()
-    if date_str not in schedule:
-        return False
-    if preacher not in schedule[date_str]:
-        return False
-    schedule[date_str].remove(preacher)
-    if not schedule[date_str]:
-        del schedule[date_str]
-    save_schedule_to_file(schedule)
-    return True
+    return store.delete_preacher(date_str, preacher)
 
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin_chat(update):
         return
-    schedule = load_schedule()
-    if not schedule:
+    if not await astore.has_schedule():
         await update.message.reply_text("Немає жодних дат у розкладі для видалення.")
         return
 
-    # Отримуємо усі дати, що є в розкладі
-    all_dates = sorted(schedule.keys())
+    # Ставимо стан для користувача: дату можна обрати кнопкою або ввести
+    start_step(update.effective_user.id, "waiting_for_delete_date")
+    await send_page(update.message, "delete", *await astore.run(None, initial_month, "schedule_days"))
+
+# ---------------------------------------------------------------------
+#            ПОМІСЯЧНІ СТОРІНКИ З INLINE-КНОПКАМИ
+# ---------------------------------------------------------------------
+# Довгі списки (розклад, події, вибір дати чи події для видалення)
+# показуються по місяцю на сторінку з кнопками ◀️/▶️. Сусідні сторінки
+# шукаються по індексу дат (найближчий день до/після місяця), тож
+# сторінка коштує пропорційно до власного розміру, а не всієї історії.
+
+def _schedule_page(start: date, end: date):
+    lines = [
+        f"📆 {entry.date_str} ({SHORT_DAYS_OF_WEEK[entry.weekday]}) "
+        f"Проповідники 🗣 {', '.join(entry.preachers)}"
+        for entry in store.schedule_between(start, end)
+    ]
+    return lines, []
 
-    # Формуємо клавіатуру з дат
-    keyboard = [[KeyboardButton(date_str)] for date_str in all_dates]
+def _events_page(start: date, end: date):
+    lines = [
+        f"📅 {event.date_str} ({SHORT_DAYS_OF_WEEK[event.weekday]}) — {event.title}"
+        for event in store.events_between(start, end)
+    ]
+    return lines, []
+
+def _button_text(text: str, limit: int = 60) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _delete_page(start: date, end: date):
+    rows = [
+        [InlineKeyboardButton(
+            _button_text(f"{entry.date_str} ({SHORT_DAYS_OF_WEEK[entry.weekday]}) — {', '.join(entry.preachers)}"),
+            callback_data=f"del|{entry.day}",
+        )]
+        for entry in store.schedule_between(start, end)
+    ]
+    return ["Оберіть дату кнопкою або введіть ДД.ММ.РРРР:"] if rows else [], rows
+
+def event_token(event: Event) -> int:
+    """Коротка контрольна сума назви для callback_data (ліміт Telegram — 64 байти)."""
+    return zlib.crc32(event.title.encode("utf-8"))
+
+def _delete_event_page(start: date, end: date):
+    rows = [
+        [InlineKeyboardButton(
+            _button_text(f"{event.date_str} — {event.title}"),
+            callback_data=f"dev|{event.day}|{event_token(event)}",
+        )]
+        for event in store.events_between(start, end)
+    ]
+    return ["Оберіть подію для видалення:"] if rows else [], rows
 
-    # Ставимо стан для користувача
-    user_states[update.effective_user.id] = "waiting_for_delete_date"
+# вид -> (заголовок, метод сховища з днями, функція сторінки)
+PAGE_VIEWS = {
+    "show": ("Розклад проповідей", "schedule_days", _schedule_page),
+    "events": ("Події", "event_days", _events_page),
+    "delete": ("Видалення з розкладу", "schedule_days", _delete_page),
+    "delete_event": ("Видалення події", "event_days", _delete_event_page),
+}
 
-    await update.message.reply_text(
-        "Оберіть дату, яку хочете видалити (цілком або окремих проповідників):",
-        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True),
+def initial_month(days_method: str) -> tuple:
+    """
+    Перша сторінка: поточний місяць, якщо в ньому чи далі щось є
+    (тоді — найближчий такий місяць), інакше останній місяць із записами.
+    """
+    current = datetime.now().date()
+    days = getattr(store, days_method)
+    found = days(start=current.replace(day=1), limit=1) or days(limit=1, reverse=True)
+    chosen = date.fromordinal(found[0]) if found else current
+    return chosen.year, chosen.month
+
+def render_page(view: str, year: int, month: int) -> tuple:
+    """(частини тексту не довші за MESSAGE_LIMIT, InlineKeyboardMarkup) для сторінки."""
+    # Кнопки ◀️/▶️ залежать від сусідніх місяців, тож ключ — загальна ревізія
+    return render_cache.get_or_render(
+        (view, year, month, store.current_revision()),
+        lambda: _render_page(view, year, month),
+    )
+
+def _render_page(view: str, year: int, month: int) -> tuple:
+    title, days_method, page = PAGE_VIEWS[view]
+    start, end = month_bounds(year, month)
+    lines, rows = page(start, end)
+    days = getattr(store, days_method)
+    nav = []
+    before = days(end=start - timedelta(days=1), limit=1, reverse=True)
+    if before:
+        shown = date.fromordinal(before[0])
+        nav.append(InlineKeyboardButton(
+            f"◀️ {shown.month:02d}.{shown.year}",
+            callback_data=f"page|{view}|{shown.year}|{shown.month}",
+        ))
+    after = days(start=end + timedelta(days=1), limit=1)
+    if after:
+        shown = date.fromordinal(after[0])
+        nav.append(InlineKeyboardButton(
+            f"{shown.month:02d}.{shown.year} ▶️",
+            callback_data=f"page|{view}|{shown.year}|{shown.month}",
+        ))
+    if nav:
+        rows.append(nav)
+    chunks = join_chunks(
+        [f"{title} — {month:02d}.{year}", ""] + (lines or ["За цей місяць записів немає."]),
+        "\n",
     )
+    return chunks, InlineKeyboardMarkup(rows) if rows else None
+
+async def send_page(message, view: str, year: int, month: int):
+    chunks, markup = await astore.run(None, render_page, view, year, month)
+    for i, chunk in enumerate(chunks, 1):
+        await message.reply_text(chunk, reply_markup=markup if i == len(chunks) else None)
+
+async def page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки ◀️/▶️: перемальовує повідомлення сторінкою іншого місяця."""
+    query = update.callback_query
+    await query.answer()
+    if not is_admin_chat(update):
+        return
+    _, view, year, month = query.data.split("|")
+    if view not in PAGE_VIEWS:
+        return
+    chunks, markup = await astore.run(None, render_page, view, int(year), int(month))
+    try:
+        await query.edit_message_text(chunks[0], reply_markup=markup if len(chunks) == 1 else None)
+    except BadRequest:
+        # Вміст не змінився (подвійне натискання) — нічого робити
+        pass
+    for i, chunk in enumerate(chunks[1:], 2):
+        await query.message.reply_text(chunk, reply_markup=markup if i == len(chunks) else None)
 
 async def end_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/show [ММ.РРРР] — розклад помісячно з кнопками ◀️/▶️."""
     if not is_admin_chat(update):
         return
-    schedule = load_schedule()
-    if not schedule:
+    if not await astore.has_schedule():
         await update.message.reply_text("Розклад порожній.")
         return
+    text = command_argument(update)
+    try:
+        year, month = (
+            parse_export_month(text, datetime.now()) if text
+            else await astore.run(None, initial_month, "schedule_days")
+        )
+    except ValueError:
+        await update.message.reply_text("Використання: /show [ММ.РРРР]")
+        return
+    await send_page(update.message, "show", year, month)
 
-    result = "*Розклад проповідей:*\n\n"
-    for date, preacher in sorted(schedule.items()):
-        day_of_week = SHORT_DAYS_OF_WEEK[datetime.strptime(date, "%d.%m.%Y").weekday()]
-        result += f"📆 {date} ({day_of_week}) Проповідники 🗣 {preacher}\n"
-
-    await update.message.reply_text(result, parse_mode="Markdown")
-
-async def get_chat_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    thread_id = update.message.message_thread_id
-    await update.message.reply_text(f"Chat ID: {chat_id}\nThread ID: {thread_id}")
-
-async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
-    print(f"Помилка: {context.error}")
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
+def command_argument(update: Update) -> str:
+    """Текст після назви команди (або порожній рядок)."""
+    parts = update.message.text.strip().split(maxsplit=1)
+    return parts[1].strip() if len(parts) > 1 else ""
 
-    if user_id in user_states:
-        state = user_states[user_id]
-
-        # ---------------------------------------------------------------------
-        #            СЦЕНАРІЙ ДОДАВАННЯ (ВЖЕ БУВ У ВАШОМУ КОДІ)
-        # ---------------------------------------------------------------------
-        if state == "waiting_for_date":
-            selected_date = update.message.text.strip()
-            user_states[user_id] = {
-                "state": "waiting_for_preacher",
-                "date": selected_date
-            }
-            keyboard = [[KeyboardButton(name)] for name in PREACHERS]
-            await update.message.reply_text(
-                "Оберіть проповідника:",
-                reply_markup=ReplyKeyboardMarkup(
-                    keyboard, one_time_keyboard=True, resize_keyboard=True
-                ),
-            )
+def split_names(text: str):
+    """"Ім'я = Інше ім'я" -> ("Ім'я", "Інше ім'я") або None."""
+    if "=" not in text:
+        return None
+    left, right = (part.strip() for part in text.split("=", 1))
+    return (left, right) if left and right else None
 
-        elif isinstance(state, dict) and state.get("state") == "waiting_for_preacher":
-            preacher = update.message.text.strip()
-            date = state["date"]
+async def preachers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin_chat(update):
+        return
+    lines = ["*Проповідники:*", ""]
+    for name, active, aliases in roster.members():
+        line = f"{'✅' if active else '⛔️'} {name}"
+        if aliases:
+            line += f" (також: {', '.join(aliases)})"
+        lines.append(line)
+    lines.append("")
+    lines.append(
+        "Керування: /add\\_preacher Ім'я, /rename\\_preacher Старе = Нове, "
+        "/alias\\_preacher Ім'я = Інше написання, /deactivate\\_preacher Ім'я, "
+        "/activate\\_preacher Ім'я. Неактивне написання з історії зливається з "
+        "проповідником через /alias\\_preacher Ім'я = Написання"
+    )
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
 
-            # Зберігаємо запис у базі
-            new_entry = {date: preacher}
-            save_schedule(new_entry)
+async def add_preacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin_chat(update):
+        return
+    name = command_argument(update)
+    if not Roster.valid_name(name):
+        await update.message.reply_text(
+            "Використання: /add_preacher Прізвище І. (без символів | , ;)"
+        )
+        return
+    await astore.run("roster", roster.add, name)
+    store.invalidate_all()
+    await update.message.reply_text(f"Проповідника '{name}' додано до списку.")
 
-            schedule = load_schedule()
-            propovidnyky = ", ".join(schedule[date])
-            await update.message.reply_text(
-                f"Проповідь на {date} збережено. Проповідники: {propovidnyky}"
-            )
+async def rename_preacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin_chat(update):
+        return
+    names = split_names(command_argument(update))
+    if not names or not Roster.valid_name(names[1]):
+        await update.message.reply_text(
+            "Використання: /rename_preacher Старе ім'я = Нове ім'я (без символів | , ;)"
+        )
+        return
+    renamed = await astore.run("roster", roster.rename, *names)
+    if renamed is None:
+        # Нове ім'я вже є — якщо старе відоме лише з історії, зливаємо їх
+        if await merge_preachers(update, *names):
+            return
+        await update.message.reply_text(
+            "Не вдалося перейменувати: старе ім'я невідоме або нове вже зайняте."
+        )
+        return
+    previous, preacher_id = renamed
+    await astore.rename_preacher(preacher_id)
+    await update.message.reply_text(
+        f"'{previous}' перейменовано на '{names[1]}' в усіх записах розкладу."
+    )
 
-            # Очищаємо стан користувача
-            del user_states[user_id]
+async def merge_preachers(update: Update, source_name: str, target_name: str) -> bool:
+    """
+    Зливає неактивне написання з історії з проповідником target_name і
+    переписує його записи розкладу. False, якщо злиття неможливе.
+    """
+    merged = await astore.run("roster", roster.merge, source_name, target_name)
+    if merged is None:
+        return False
+    await astore.merge_preacher(*merged)
+    await update.message.reply_text(
+        f"'{source_name}' об'єднано з '{roster.name_of(merged[1])}': "
+        f"записи розкладу переписано."
+    )
+    return True
 
-        # ---------------------------------------------------------------------
-        #            СЦЕНАРІЙ ВИДАЛЕННЯ
-        # ---------------------------------------------------------------------
-        elif state == "waiting_for_delete_date":
-            # Користувач обрав дату для видалення
-            chosen_date = update.message.text.strip()
+async def alias_preacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin_chat(update):
+        return
+    names = split_names(command_argument(update))
+    if not names or not Roster.valid_alias(names[1]):
+        await update.message.reply_text(
+            "Використання: /alias_preacher Ім'я = Інше написання (без символів | , ; -)"
+        )
+        return
+    if await astore.run("roster", roster.add_alias, *names):
+        await update.message.reply_text(f"'{names[1]}' тепер означає '{names[0]}'.")
+    # Написання зайняте — зливаємо, якщо воно належить проповіднику лише з історії
+    elif not await merge_preachers(update, names[1], names[0]):
+        await update.message.reply_text(
+            "Не вдалося: ім'я невідоме або таке написання вже використовується."
+        )
 
-            schedule = load_schedule()
-            if chosen_date not in schedule:
-                await update.message.reply_text("Такої дати в розкладі немає. Спробуйте ще раз.")
-                return
+async def _set_preacher_active(update: Update, active: bool):
+    if not is_admin_chat(update):
+        return
+    name = command_argument(update)
+    if not name or not await astore.run("roster", roster.set_active, name, active):
+        await update.message.reply_text("Такого проповідника немає в списку (/preachers).")
+        return
+    store.invalidate_all()
+    state = "активний" if active else "неактивний"
+    await update.message.reply_text(f"Проповідник '{name}' тепер {state}.")
+
+async def deactivate_preacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _set_preacher_active(update, False)
+
+async def activate_preacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _set_preacher_active(update, True)
+
+def next_service_day(current_date: date) -> date:
+    """Найближчий четвер або неділя, починаючи з current_date."""
+    while current_date.weekday() not in (3, 6):
+        current_date += timedelta(days=1)
+    return current_date
+
+def format_day(day: int) -> str:
+    return f"{date_str_from_day(day)} ({SHORT_DAYS_OF_WEEK[(day - 1) % 7]})"
+
+def find_lines(matches: list, current: date) -> list:
+    """Для кожного знайденого проповідника — наступні дати і остання проповідь."""
+    lines = []
+    for preacher_id in matches:
+        upcoming = store.preacher_days(preacher_id, current, limit=5)
+        last = store.preacher_days(
+            preacher_id, end=current - timedelta(days=1), limit=1, reverse=True
+        )
+        line = f"🗣 {roster.name_of(preacher_id)}\n"
+        line += "   Наступні: " + (", ".join(map(format_day, upcoming)) or "немає") + "\n"
+        line += "   Востаннє: " + (format_day(last[0]) if last else "—")
+        lines.append(line)
+    return lines
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/find <початок імені> — коли проповідник проповідує наступного разу."""
+    if not is_admin_chat(update):
+        return
+    text = command_argument(update)
+    if not text:
+        await update.message.reply_text("Використання: /find Прізвище (можна перші літери)")
+        return
+    matches = roster.search(text)
+    if not matches:
+        await update.message.reply_text(f"Не знайдено проповідників за запитом '{text}'.")
+        return
+    lines = await astore.run(None, find_lines, matches, datetime.now().date())
+    for chunk in join_chunks(lines, "\n\n"):
+        await update.message.reply_text(chunk)
 
-            preachers = schedule[chosen_date]
-            count = len(preachers)
-
-            # Записуємо все необхідне в стан
-            user_states[user_id] = {
-                "state": "waiting_for_delete_decision",
-                "date": chosen_date,
-                "preachers": preachers
-            }
-
-            if count == 1:
-                # Якщо лише один проповідник
-                keyboard = [
-                    [KeyboardButton("Видалити дату повністю")],
-                    [KeyboardButton(f"Видалити проповідника: {preachers[0]}")],
-                ]
-                await update.message.reply_text(
-                    f"Для дати {chosen_date} є лише один проповідник: {preachers[0]}.\n"
-                    "Видалити дату цілком чи тільки проповідника?",
-                    reply_markup=ReplyKeyboardMarkup(
-                        keyboard, one_time_keyboard=True, resize_keyboard=True
-                    ),
-                )
-            else:
-                # Якщо проповідників декілька
-                keyboard = [
-                    [KeyboardButton("Видалити дату повністю")],
-                    [KeyboardButton("Видалити одного проповідника")],
-                ]
-                await update.message.reply_text(
-                    f"Для дати {chosen_date} є {count} проповідників: {', '.join(preachers)}.\n"
-                    "Видалити дату цілком або лише одного?",
-                    reply_markup=ReplyKeyboardMarkup(
-                        keyboard, one_time_keyboard=True, resize_keyboard=True
-                    ),
-                )
+async def free_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/free [ДД.ММ.РРРР] — хто з активних проповідників вільний на дату."""
+    if not is_admin_chat(update):
+        return
+    text = command_argument(update)
+    try:
+        chosen = parse_date(text) if text else next_service_day(datetime.now().date())
+    except ValueError:
+        await update.message.reply_text("Використання: /free ДД.ММ.РРРР (без дати — найближче зібрання)")
+        return
+    date_str = chosen.strftime(DATE_FORMAT)
+    busy = await astore.preachers_on(date_str)
+    busy_ids = {roster.find(name) for name in busy}
+    free = [name for i, name in zip(roster.active_ids(), roster.active_names()) if i not in busy_ids]
+    day_of_week = SHORT_DAYS_OF_WEEK[chosen.weekday()]
+    result = f"📆 {date_str} ({day_of_week})\n"
+    result += f"Записані: {', '.join(busy) if busy else 'нікого'}\n"
+    result += f"Вільні: {', '.join(free) if free else 'нікого'}"
+    await update.message.reply_text(result)
+
+STATS_USAGE = (
+    "Використання: /stats [month|quarter|year|ММ.РРРР|РРРР|check]\n"
+    "Без параметра — поточний квартал."
+)
+
+def parse_stats_period(text: str, now: datetime) -> tuple:
+    """(назва періоду, [(рік, місяць), ...]) для /stats (ValueError при помилці)."""
+    quarter_start = (now.month - 1) // 3 * 3 + 1
+    if text in ("", "quarter"):
+        months = months_between((now.year, quarter_start), (now.year, quarter_start + 2))
+        return f"{quarter_start // 3 + 1} квартал {now.year}", months
+    if text == "month":
+        text = now.strftime("%m.%Y")
+    if text == "year":
+        text = str(now.year)
+    if text.isdigit() and len(text) == 4:
+        return f"{text} рік", months_between((int(text), 1), (int(text), 12))
+    year, month = parse_export_month(text, now)
+    return f"{month:02d}.{year}", [(year, month)]
+
+def stats_lines(months: list, current: date) -> list:
+    """Рядок на проповідника, від найзавантаженішого; активні без проповідей — теж."""
+    totals = store.preacher_totals(months)
+    preacher_ids = [i for i in roster.active_ids() if i not in totals] + list(totals)
+    rows = []
+    for preacher_id in preacher_ids:
+        thursday, sunday, other = totals.get(preacher_id, (0, 0, 0))
+        last = store.preacher_days(preacher_id, end=current, limit=1, reverse=True)
+        line = f"{roster.name_of(preacher_id)} — {thursday + sunday + other} (Чт {thursday}, Нд {sunday}"
+        line += f", інші {other})" if other else ")"
+        line += f", востаннє {(current.toordinal() - last[0])} дн. тому" if last else ", ще не проповідував"
+        rows.append((-(thursday + sunday + other), roster.name_of(preacher_id), line))
+    rows.sort()
+    return [line for _, _, line in rows]
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /stats [період] — скільки разів кожен проповідник проповідував
+    (четвер/неділя) і скільки днів минуло від його останньої проповіді.
+    """
+    if not is_admin_chat(update):
+        return
+    text = command_argument(update).lower()
+    if text == "check":
+        if await astore.verify_stats():
+            await update.message.reply_text("✅ Статистика узгоджена з розкладом.")
+        else:
+            await update.message.reply_text("⚠️ Статистика розходилась з розкладом і була перебудована.")
+        return
+    now = datetime.now()
+    try:
+        title, months = parse_stats_period(text, now)
+    except ValueError:
+        await update.message.reply_text(STATS_USAGE)
+        return
+    lines = await astore.run(None, stats_lines, months, now.date())
+    parts = [f"📊 Статистика за {title}:"] + lines
+    for chunk in join_chunks(parts, "\n"):
+        await update.message.reply_text(chunk)
 
-        elif (
-            isinstance(state, dict) and
-            state.get("state") == "waiting_for_delete_decision"
-        ):
-            chosen_date = state["date"]
-            preachers = state["preachers"]
-            decision = update.message.text.strip().lower()
-
-            if "повністю" in decision:
-                # Користувач обрав видалити усю дату
-                success = delete_schedule_date(chosen_date)
-                if success:
-                    await update.message.reply_text(
-                        f"Дату {chosen_date} видалено повністю."
-                    )
-                else:
-                    await update.message.reply_text(
-                        f"Не вдалося видалити дату {chosen_date} (вона могла бути вже видалена)."
-                    )
-                del user_states[user_id]
-
-            elif "одного" in decision:
-                # Показуємо список проповідників для вибору
-                user_states[user_id]["state"] = "waiting_for_delete_preacher"
-                keyboard = [[KeyboardButton(p)] for p in preachers]
-                await update.message.reply_text(
-                    "Оберіть проповідника, якого хочете видалити:",
-                    reply_markup=ReplyKeyboardMarkup(
-                        keyboard, one_time_keyboard=True, resize_keyboard=True
-                    ),
-                )
-            elif "проповідника:" in decision:
-                # Це варіант, якщо один проповідник і кнопка мала вигляд "Видалити проповідника: Іванов І."
-                preacher_to_delete = decision.split(":", 1)[1].strip()
-                success = delete_schedule_preacher(chosen_date, preacher_to_delete)
-                if success:
-                    await update.message.reply_text(
-                        f"Проповідника '{preacher_to_delete}' з дати {chosen_date} видалено."
-                    )
-                else:
-                    await update.message.reply_text(
-                        f"Не вдалося видалити проповідника '{preacher_to_delete}'."
-                    )
-                del user_states[user_id]
+def plan_rotation(slot_days: list, candidates: list, loads: dict, booked: dict,
+                  min_spacing: int) -> list:
+    """
+    Жадібний розподіл вільних слотів між проповідниками.
+    slot_days — вільні дні (порядкові номери) за зростанням; loads — {id: кількість
+    проповідей за період вирівнювання}; booked — {id: відсортовані дні, на які
+    проповідник уже записаний} (доповнюється запланованими).
+    Купа за (навантаження, день останньої проповіді, id): кожен слот отримує
+    найменш завантаженого з доступних, при рівності — того, хто довше не
+    проповідував. Недоступні (період недоступності, замалий інтервал до сусідніх
+    проповідей) повертаються в купу після вибору. O(слоти × log реєстру) у
+    звичайному випадку. Повертає [(день, id або None), ...].
+    """
+    heap = []
+    for preacher_id in candidates:
+        days = booked.setdefault(preacher_id, [])
+        first = slot_days[0] if slot_days else 0
+        before = bisect.bisect_left(days, first)
+        last = days[before - 1] if before else 0
+        heap.append((loads.get(preacher_id, 0), last, preacher_id))
+    heapq.heapify(heap)
+
+    def available(preacher_id: int, day: int) -> bool:
+        if roster.is_blacked_out(preacher_id, day):
+            return False
+        days = booked[preacher_id]
+        i = bisect.bisect_left(days, day)
+        if i < len(days) and days[i] - day < min_spacing:
+            return False
+        return not (i and day - days[i - 1] < min_spacing)
+
+    plan = []
+    for day in slot_days:
+        skipped = []
+        chosen = None
+        while heap:
+            item = heapq.heappop(heap)
+            if available(item[2], day):
+                chosen = item
+                break
+            skipped.append(item)
+        for item in skipped:
+            heapq.heappush(heap, item)
+        if chosen is None:
+            plan.append((day, None))
+            continue
+        load, _, preacher_id = chosen
+        bisect.insort(booked[preacher_id], day)
+        heapq.heappush(heap, (load + 1, day, preacher_id))
+        plan.append((day, preacher_id))
+    return plan
+
+def parse_plan_period(text: str, now: datetime) -> list:
+    """Місяці для /autoplan: next (типово), current, quarter, ММ.РРРР [ММ.РРРР]."""
+    args = text.split()
+    if not args:
+        args = ["next"]
+    if args == ["quarter"]:
+        start = (now.year, now.month)
+        return months_between(start, shift_month(start, 2))
+    if len(args) > 2:
+        raise ValueError(text)
+    months = months_between(
+        parse_export_month(args[0], now), parse_export_month(args[-1], now)
+    )
+    if not months or len(months) > AUTOPLAN_MAX_MONTHS:
+        raise ValueError(text)
+    return months
+
+def build_autoplan(months: list, current: date) -> list:
+    """Пропозиція для всіх вільних четвергів і неділь у місяцях, починаючи з current."""
+    slot_days = [
+        day
+        for year, month in months
+        for day in (parse_date(d).toordinal() for d in get_thursday_sunday_dates(year, month))
+        if day >= current.toordinal()
+    ]
+    taken = {entry.day for entry in store.schedule_between(
+        date.fromordinal(slot_days[0]), date.fromordinal(slot_days[-1])
+    )} if slot_days else set()
+    slot_days = [day for day in slot_days if day not in taken]
+    if not slot_days:
+        return []
+    history = months_between(shift_month(months[0], -AUTOPLAN_HISTORY_MONTHS), months[-1])
+    loads = {i: sum(counts) for i, counts in store.preacher_totals(history).items()}
+    window_start = date.fromordinal(slot_days[0] - AUTOPLAN_MIN_SPACING_DAYS)
+    window_end = date.fromordinal(slot_days[-1] + AUTOPLAN_MIN_SPACING_DAYS)
+    candidates = roster.active_ids()
+    booked = {
+        i: store.preacher_days(i, window_start, window_end) for i in candidates
+    }
+    return plan_rotation(slot_days, candidates, loads, booked, AUTOPLAN_MIN_SPACING_DAYS)
+
+def commit_autoplan(plan: list) -> int:
+    """Записує план однією пакетною операцією; повертає кількість доданих записів."""
+    # Поки план переглядали, слот могли заповнити вручну — такі пропускаємо
+    assignments = [
+        (date_str_from_day(day), roster.name_of(preacher_id))
+        for day, preacher_id in plan
+        if not store.preachers_on(date_str_from_day(day))
+    ]
+    return store.add_preachers(assignments)
 
-            else:
-                # Невідомий варіант відповіді
-                await update.message.reply_text("Невідома дія. Спробуйте ще раз /delete.")
-                del user_states[user_id]
+AUTOPLAN_USAGE = (
+    "Використання: /autoplan [next|current|quarter|ММ.РРРР [ММ.РРРР]]\n"
+    "Пропонує проповідників на всі вільні четверги й неділі; "
+    "наявні записи не змінюються."
+)
+AUTOPLAN_SAVE = "✅ Зберегти план"
+AUTOPLAN_CANCEL = "❌ Скасувати"
 
-        elif (
-            isinstance(state, dict) and
-            state.get("state") == "waiting_for_delete_preacher"
-        ):
-            chosen_date = state["date"]
-            chosen_preacher = update.message.text.strip()
-            success = delete_schedule_preacher(chosen_date, chosen_preacher)
-            if success:
-                await update.message.reply_text(
-                    f"Проповідника '{chosen_preacher}' з дати {chosen_date} видалено."
-                )
-            else:
-                await update.message.reply_text(
-                    f"Не вдалося видалити '{chosen_preacher}'. Можливо, немає такого проповідника."
-                )
-            del user_states[user_id]
+async def autoplan_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /autoplan [період] — автоматичний розподіл вільних четвергів і неділь
+    між активними проповідниками з урахуванням навантаження, періодів
+    недоступності і мінімального інтервалу. Спершу показує план; запис —
+    після підтвердження, однією пакетною операцією.
+    """
+    if not is_admin_chat(update):
+        return
+    now = datetime.now()
+    try:
+        months = parse_plan_period(command_argument(update).lower(), now)
+    except ValueError:
+        await update.message.reply_text(AUTOPLAN_USAGE)
+        return
+    plan = await astore.run(None, build_autoplan, months, now.date())
+    if not plan:
+        await update.message.reply_text("Вільних четвергів і неділь у цьому періоді немає.")
+        return
+    lines = ["🗓 Пропозиція розкладу:", ""]
+    for day, preacher_id in plan:
+        name = roster.name_of(preacher_id) if preacher_id is not None else "⚠️ нікого немає"
+        lines.append(f"📆 {format_day(day)} — {name}")
+    proposed = [[day, preacher_id] for day, preacher_id in plan if preacher_id is not None]
+    start_step(update.effective_user.id, "waiting_for_autoplan_confirm", plan=proposed)
+    keyboard = [[KeyboardButton(AUTOPLAN_SAVE), KeyboardButton(AUTOPLAN_CANCEL)]]
+    chunks = join_chunks(lines, "\n")
+    for chunk in chunks[:-1]:
+        await update.message.reply_text(chunk)
+    await update.message.reply_text(
+        chunks[-1],
+        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True),
+    )
 
-        # ---------------------------------------------------------------------
-        #            СЦЕНАРІЙ ДОДАВАННЯ ПОДІЇ
-        # ---------------------------------------------------------------------
-        elif state == "waiting_for_event_date":
-            date_text = update.message.text.strip()
-            try:
-                datetime.strptime(date_text, "%d.%m.%Y")
-            except ValueError:
-                await update.message.reply_text(
-                    "Невірний формат дати. Введіть у форматі ДД.ММ.РРРР (наприклад: 25.03.2026):"
-                )
-                return
-            user_states[user_id] = {"state": "waiting_for_event_title", "date": date_text}
-            await update.message.reply_text("Введіть назву події:")
-
-        elif isinstance(state, dict) and state.get("state") == "waiting_for_event_title":
-            title = update.message.text.strip()
-            date = state["date"]
-            save_event(date, title)
-            await update.message.reply_text(f"Подію '{title}' на {date} збережено.")
-            del user_states[user_id]
-
-        # ---------------------------------------------------------------------
-        #            СЦЕНАРІЙ ВИДАЛЕННЯ ПОДІЇ
-        # ---------------------------------------------------------------------
-        elif isinstance(state, dict) and state.get("state") == "waiting_for_delete_event":
-            chosen = update.message.text.strip()
-            events = state["events"]
-            matched = next((e for e in events if f"{e['date']} — {e['title']}" == chosen), None)
-            if not matched:
-                await update.message.reply_text("Подію не знайдено. Спробуйте ще раз /delete_event.")
-                del user_states[user_id]
-                return
-            success = delete_event(matched["date"], matched["title"])
-            if success:
-                await update.message.reply_text(f"Подію '{matched['title']}' на {matched['date']} видалено.")
-            else:
-                await update.message.reply_text("Не вдалося видалити подію.")
-            del user_states[user_id]
+async def blackout_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /blackout — періоди недоступності проповідників (для /autoplan).
+    /blackout Ім'я = ДД.ММ.РРРР[-ДД.ММ.РРРР] додає період, /blackout Ім'я = clear очищає.
+    """
+    if not is_admin_chat(update):
+        return
+    text = command_argument(update)
+    if not text:
+        lines = ["Періоди недоступності:"]
+        for preacher_id in roster.ids():
+            periods = roster.blackouts(preacher_id)
+            if periods:
+                lines.append(f"{roster.name_of(preacher_id)}: " + ", ".join(
+                    f"{date_str_from_day(first)}–{date_str_from_day(last)}"
+                    for first, last in periods
+                ))
+        if len(lines) == 1:
+            lines.append("немає")
+        await update.message.reply_text("\n".join(lines))
+        return
+    names = split_names(text)
+    if not names:
+        await update.message.reply_text(
+            "Використання: /blackout Ім'я = ДД.ММ.РРРР[-ДД.ММ.РРРР] або /blackout Ім'я = clear"
+        )
+        return
+    name, period = names
+    if period.lower() == "clear":
+        if await astore.run("roster", roster.clear_blackouts, name):
+            await update.message.reply_text(f"Періоди недоступності для '{name}' очищено.")
+        else:
+            await update.message.reply_text(f"Проповідника '{name}' немає в списку.")
+        return
+    try:
+        first, _, last = period.partition("-")
+        first_day = parse_date(first.strip()).toordinal()
+        last_day = parse_date(last.strip()).toordinal() if last else first_day
+    except ValueError:
+        await update.message.reply_text("Невірний формат дати. Використовуйте ДД.ММ.РРРР.")
+        return
+    if last_day < first_day:
+        await update.message.reply_text("Кінець періоду раніше за початок.")
+        return
+    if await astore.run("roster", roster.add_blackout, name, first_day, last_day):
+        await update.message.reply_text(
+            f"'{name}' недоступний з {date_str_from_day(first_day)} по {date_str_from_day(last_day)}."
+        )
+    else:
+        await update.message.reply_text(f"Проповідника '{name}' немає в списку.")
+
+async def get_chat_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    thread_id = update.message.message_thread_id
+    await update.message.reply_text(f"Chat ID: {chat_id}\nThread ID: {thread_id}")
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    print(f"Помилка: {context.error}")
+
+async def ask_delete_decision(message, user_id: int, chosen_date: str):
+    """Другий крок /delete: видалити дату повністю чи окремого проповідника."""
+    preachers = await astore.preachers_on(chosen_date)
+    if not preachers:
+        await message.reply_text("Такої дати в розкладі немає. Спробуйте ще раз.")
+        return
+
+    count = len(preachers)
+
+    # Записуємо в стан лише день і id проповідників
+    start_step(
+        user_id, "waiting_for_delete_decision",
+        date=parse_date(chosen_date).toordinal(),
+        preachers=[roster.id_of(p) for p in preachers],
+    )
+
+    if count == 1:
+        # Якщо лише один проповідник
+        keyboard = [
+            [KeyboardButton("Видалити дату повністю")],
+            [KeyboardButton(f"Видалити проповідника: {preachers[0]}")],
+        ]
+        await message.reply_text(
+            f"Для дати {chosen_date} є лише один проповідник: {preachers[0]}.\n"
+            "Видалити дату цілком чи тільки проповідника?",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard, one_time_keyboard=True, resize_keyboard=True
+            ),
+        )
+    else:
+        # Якщо проповідників декілька
+        keyboard = [
+            [KeyboardButton("Видалити дату повністю")],
+            [KeyboardButton("Видалити одного проповідника")],
+        ]
+        await message.reply_text(
+            f"Для дати {chosen_date} є {count} проповідників: {', '.join(preachers)}.\n"
+            "Видалити дату цілком або лише одного?",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard, one_time_keyboard=True, resize_keyboard=True
+            ),
+        )
+
+async def delete_date_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка з датою на сторінці /delete."""
+    query = update.callback_query
+    await query.answer()
+    if not is_admin_chat(update):
+        return
+    day = int(query.data.split("|")[1])
+    await ask_delete_decision(query.message, query.from_user.id, date_str_from_day(day))
+
+async def remove_event(message, event: Event):
+    if await astore.run("events", delete_event, event.date_str, event.title):
+        await message.reply_text(f"Подію '{event.title}' на {event.date_str} видалено.")
+    else:
+        await message.reply_text("Не вдалося видалити подію.")
+
+async def delete_event_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка з подією на сторінці /delete_event: видаляє її і оновлює сторінку."""
+    query = update.callback_query
+    await query.answer()
+    if not is_admin_chat(update):
+        return
+    _, day, token = query.data.split("|")
+    chosen = date.fromordinal(int(day))
+    matched = next(
+        (e for e in await astore.events_between(chosen, chosen) if event_token(e) == int(token)),
+        None,
+    )
+    state = user_states.get(query.from_user.id)
+    if isinstance(state, dict) and state.get("state") == "waiting_for_delete_event":
+        user_states.pop(query.from_user.id)
+    if not matched:
+        await query.message.reply_text("Подію не знайдено (можливо, її вже видалено).")
+        return
+    await remove_event(query.message, matched)
+    chunks, markup = await astore.run(None, render_page, "delete_event", chosen.year, chosen.month)
+    try:
+        await query.edit_message_text(chunks[0], reply_markup=markup if len(chunks) == 1 else None)
+    except BadRequest:
+        pass
+
+_user_locks = weakref.WeakValueDictionary()
+
+def user_lock(user_id: int) -> asyncio.Lock:
+    """
+    Замок користувача: з concurrent_updates його повідомлення в діалозі
+    все одно обробляються по черзі (стан читається і змінюється без гонок).
+    Замок, який ніхто не тримає, зникає зі словника сам.
+    """
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    return lock
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Текстові повідомлення поза командами — це кроки діалогів. Спершу
+    перевіряється чат, потім крок шукається в CONVERSATION_STEPS за назвою
+    стану (O(1)), тож нові діалоги не сповільнюють обробку повідомлень.
+    """
+    if not is_admin_chat(update):
+        return
+    user_id = update.effective_user.id
+    async with user_lock(user_id):
+        state = user_states.get(user_id)
+        if state is None:
+            return
+        step = CONVERSATION_STEPS.get(state.get("state")) if isinstance(state, dict) else None
+        if step is None or not valid_payload(step[1], state):
+            # Стан зі старої версії бота або пошкоджений — діалог починається знову
+            user_states.pop(user_id)
+            return
+        await step[0](update, user_id, state)
+
+# ---------------------------------------------------------------------
+#            СЦЕНАРІЙ ДОДАВАННЯ
+# ---------------------------------------------------------------------
+@conversation_step("waiting_for_date")
+async def step_add_date(update: Update, user_id: int, state: dict):
+    try:
+        selected_date = parse_date(update.message.text.strip())
+    except ValueError:
+        await update.message.reply_text(
+            "Невірний формат дати. Оберіть дату з клавіатури або введіть ДД.ММ.РРРР:"
+        )
+        return
+    start_step(user_id, "waiting_for_preacher", date=selected_date.toordinal())
+    keyboard = [[KeyboardButton(name)] for name in roster.active_names()]
+    await update.message.reply_text(
+        "Оберіть проповідника:",
+        reply_markup=ReplyKeyboardMarkup(
+            keyboard, one_time_keyboard=True, resize_keyboard=True
+        ),
+    )
+
+@conversation_step("waiting_for_preacher", date=int)
+async def step_add_preacher(update: Update, user_id: int, state: dict):
+    preacher_id = roster.find(update.message.text.strip())
+    if preacher_id is None or not roster.is_active(preacher_id):
+        await update.message.reply_text(
+            "Такого проповідника немає в списку. Оберіть ім'я з клавіатури "
+            "(список: /preachers):"
+        )
+        return
+    preacher = roster.name_of(preacher_id)
+    date = date_str_from_day(state["date"])
+
+    # Зберігаємо запис у базі
+    new_entry = {date: preacher}
+    await astore.run("schedule", save_schedule, new_entry)
+
+    propovidnyky = ", ".join(await astore.preachers_on(date))
+    await update.message.reply_text(
+        f"Проповідь на {date} збережено. Проповідники: {propovidnyky}"
+    )
+
+    # Очищаємо стан користувача
+    user_states.pop(user_id)
+
+# ---------------------------------------------------------------------
+#            СЦЕНАРІЙ ВИДАЛЕННЯ
+# ---------------------------------------------------------------------
+@conversation_step("waiting_for_delete_date")
+async def step_delete_date(update: Update, user_id: int, state: dict):
+    # Користувач ввів дату для видалення (або обрав її кнопкою — див. delete_date_callback)
+    try:
+        chosen_date = parse_date(update.message.text.strip()).strftime(DATE_FORMAT)
+    except ValueError:
+        await update.message.reply_text("Невірний формат дати. Введіть ДД.ММ.РРРР:")
+        return
+    await ask_delete_decision(update.message, user_id, chosen_date)
+
+@conversation_step("waiting_for_delete_decision", date=int, preachers=list[int])
+async def step_delete_decision(update: Update, user_id: int, state: dict):
+    chosen_date = date_str_from_day(state["date"])
+    preachers = [roster.name_of(i) for i in state["preachers"]]
+    decision = update.message.text.strip().lower()
+
+    if "повністю" in decision:
+        # Користувач обрав видалити усю дату
+        user_states.pop(user_id)
+        success = await astore.run("schedule", delete_schedule_date, chosen_date)
+        if success:
+            await update.message.reply_text(
+                f"Дату {chosen_date} видалено повністю."
+            )
+        else:
+            await update.message.reply_text(
+                f"Не вдалося видалити дату {chosen_date} (вона могла бути вже видалена)."
+            )
+
+    elif "одного" in decision:
+        # Показуємо список проповідників для вибору
+        start_step(user_id, "waiting_for_delete_preacher", date=state["date"])
+        keyboard = [[KeyboardButton(p)] for p in preachers]
+        await update.message.reply_text(
+            "Оберіть проповідника, якого хочете видалити:",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard, one_time_keyboard=True, resize_keyboard=True
+            ),
+        )
+    elif "проповідника:" in decision:
+        # Це варіант, якщо один проповідник і кнопка мала вигляд "Видалити проповідника: Іванов І."
+        user_states.pop(user_id)
+        preacher_to_delete = preachers[0]
+        success = await astore.run(
+            "schedule", delete_schedule_preacher, chosen_date, preacher_to_delete
+        )
+        if success:
+            await update.message.reply_text(
+                f"Проповідника '{preacher_to_delete}' з дати {chosen_date} видалено."
+            )
+        else:
+            await update.message.reply_text(
+                f"Не вдалося видалити проповідника '{preacher_to_delete}'."
+            )
+
+    else:
+        # Невідомий варіант відповіді
+        user_states.pop(user_id)
+        await update.message.reply_text("Невідома дія. Спробуйте ще раз /delete.")
+
+@conversation_step("waiting_for_delete_preacher", date=int)
+async def step_delete_preacher(update: Update, user_id: int, state: dict):
+    user_states.pop(user_id)
+    chosen_date = date_str_from_day(state["date"])
+    chosen_preacher = update.message.text.strip()
+    success = await astore.run(
+        "schedule", delete_schedule_preacher, chosen_date, chosen_preacher
+    )
+    if success:
+        await update.message.reply_text(
+            f"Проповідника '{chosen_preacher}' з дати {chosen_date} видалено."
+        )
+    else:
+        await update.message.reply_text(
+            f"Не вдалося видалити '{chosen_preacher}'. Можливо, немає такого проповідника."
+        )
+
+# ---------------------------------------------------------------------
+#            СЦЕНАРІЙ ДОДАВАННЯ ПОДІЇ
+# ---------------------------------------------------------------------
+@conversation_step("waiting_for_event_date")
+async def step_event_date(update: Update, user_id: int, state: dict):
+    try:
+        chosen = parse_date(update.message.text.strip())
+    except ValueError:
+        await update.message.reply_text(
+            "Невірний формат дати. Введіть у форматі ДД.ММ.РРРР (наприклад: 25.03.2026):"
+        )
+        return
+    start_step(user_id, "waiting_for_event_title", date=chosen.toordinal())
+    await update.message.reply_text("Введіть назву події:")
+
+@conversation_step("waiting_for_event_title", date=int)
+async def step_event_title(update: Update, user_id: int, state: dict):
+    user_states.pop(user_id)
+    title = update.message.text.strip()
+    date = date_str_from_day(state["date"])
+    await astore.run("events", save_event, date, title)
+    await update.message.reply_text(f"Подію '{title}' на {date} збережено.")
+
+# ---------------------------------------------------------------------
+#            СЦЕНАРІЙ ВИДАЛЕННЯ ПОДІЇ
+# ---------------------------------------------------------------------
+@conversation_step("waiting_for_delete_event")
+async def step_delete_event(update: Update, user_id: int, state: dict):
+    user_states.pop(user_id)
+    date_text, _, title = update.message.text.strip().partition(" — ")
+    try:
+        chosen = parse_date(date_text.strip())
+    except ValueError:
+        chosen = None
+    matched = chosen and next(
+        (e for e in await astore.events_between(chosen, chosen) if e.title == title.strip()),
+        None,
+    )
+    if not matched:
+        await update.message.reply_text("Подію не знайдено. Спробуйте ще раз /delete_event.")
+        return
+    await remove_event(update.message, matched)
+
+# ---------------------------------------------------------------------
+#            ПІДТВЕРДЖЕННЯ АВТОПЛАНУ
+# ---------------------------------------------------------------------
+@conversation_step("waiting_for_autoplan_confirm", plan=list[list[int]])
+async def step_autoplan_confirm(update: Update, user_id: int, state: dict):
+    user_states.pop(user_id)
+    if update.message.text.strip() != AUTOPLAN_SAVE:
+        await update.message.reply_text("План не збережено.", reply_markup=ReplyKeyboardRemove())
+        return
+    added = await astore.run("schedule", commit_autoplan, state["plan"])
+    await update.message.reply_text(
+        f"План збережено: додано {added} записів.", reply_markup=ReplyKeyboardRemove()
+    )
 
 async def add_event_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin_chat(update):
         return
-    user_states[update.effective_user.id] = "waiting_for_event_date"
+    start_step(update.effective_user.id, "waiting_for_event_date")
     await update.message.reply_text(
         "Введіть дату події у форматі ДД.ММ.РРРР (наприклад: 25.03.2026):"
     )
@@ -642,89 +3289,649 @@ async def add_event_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_events_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin_chat(update):
         return
-    events = load_events()
-    now = datetime.now().date()
-    upcoming = sorted(
-        [e for e in events if datetime.strptime(e["date"], "%d.%m.%Y").date() >= now],
-        key=lambda e: datetime.strptime(e["date"], "%d.%m.%Y")
-    )
-    if not upcoming:
+    if not await astore.event_days(datetime.now().date(), limit=1):
         await update.message.reply_text("Немає запланованих подій.")
         return
-    result = "*Заплановані події:*\n\n"
-    for event in upcoming:
-        dt = datetime.strptime(event["date"], "%d.%m.%Y")
-        day_of_week = SHORT_DAYS_OF_WEEK[dt.weekday()]
-        result += f"📅 {event['date']} ({day_of_week}) — {event['title']}\n"
-    await update.message.reply_text(result, parse_mode="Markdown")
+    await send_page(update.message, "events", *await astore.run(None, initial_month, "event_days"))
 
 async def delete_event_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin_chat(update):
         return
-    events = load_events()
-    now = datetime.now().date()
-    upcoming = sorted(
-        [e for e in events if datetime.strptime(e["date"], "%d.%m.%Y").date() >= now],
-        key=lambda e: datetime.strptime(e["date"], "%d.%m.%Y")
-    )
-    if not upcoming:
+    if not await astore.event_days(datetime.now().date(), limit=1):
         await update.message.reply_text("Немає запланованих подій для видалення.")
         return
-    keyboard = [[KeyboardButton(f"{e['date']} — {e['title']}")] for e in upcoming]
-    user_states[update.effective_user.id] = {
-        "state": "waiting_for_delete_event",
-        "events": upcoming
-    }
-    await update.message.reply_text(
-        "Оберіть подію для видалення:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    )
+    # Подію можна обрати кнопкою або ввести як "ДД.ММ.РРРР — назва"
+    start_step(update.effective_user.id, "waiting_for_delete_event")
+    await send_page(update.message, "delete_event", *await astore.run(None, initial_month, "event_days"))
+
+def today() -> date:
+    """Сьогоднішня дата в часовому поясі нагадувань."""
+    return datetime.now(LOCAL_TZ).date()
+
+REMINDER_SERMON = "sermon"
+REMINDER_EVENT = "event"
+
+# Ліміт довжини одного повідомлення Telegram
+MESSAGE_LIMIT = 4096
+
+class ReminderRule:
+    """Одне правило: за скільки днів, про що і в який чат/тему нагадувати."""
+
+    __slots__ = ("lead_days", "kinds", "chat_id", "thread_id")
+
+    def __init__(self, lead_days: int, kinds: tuple, chat_id: int, thread_id=None):
+        self.lead_days = lead_days
+        self.kinds = kinds
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+
+def parse_reminder_rules(spec: str) -> list:
+    """Розбирає REMINDER_RULES у список ReminderRule (ValueError при помилці)."""
+    rules = []
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        fields = part.split(":")
+        if len(fields) not in (3, 4):
+            raise ValueError(f"правило '{part}' має бути у форматі днів:що:куди[:тема]")
+        lead_days = int(fields[0])
+        kinds = tuple(fields[1].split("+"))
+        if lead_days < 0 or not set(kinds) <= {REMINDER_SERMON, REMINDER_EVENT}:
+            raise ValueError(f"невірне правило '{part}'")
+        if fields[2] == "group":
+            chat_id, thread_id = GROUP_CHAT_ID, REMINDER_THREAD_ID
+        elif fields[2] == "admin":
+            chat_id, thread_id = ADMIN_CHAT_ID, None
+        else:
+            chat_id, thread_id = int(fields[2]), None
+        if len(fields) == 4:
+            thread_id = int(fields[3]) if fields[3] else None
+        rules.append(ReminderRule(lead_days, kinds, chat_id, thread_id))
+    return rules
+
+class ReminderEngine:
+    """
+    Нагадування за кількома правилами (за тиждень, за два дні, в день події...).
+    Для кожного окремого зсуву робиться один запит до сховища на одну дату
+    (по індексу), тож вартість перевірки не залежить від розміру історії,
+    а видалені чи змінені записи враховуються автоматично.
+    Тексти для одного чату/теми об'єднуються в якомога менше повідомлень.
+    """
+
+    def __init__(self, store: ScheduleStore, rules: list):
+        self.store = store
+        self.rules = rules
+
+    @staticmethod
+    def sermon_text(entry: ScheduleEntry) -> str:
+        return (
+            f"Нагадування!\n\n"
+            f"На зібранні {entry.date_str}:\n"
+            f"Проповідують: {', '.join(entry.preachers)}"
+        )
+
+    @staticmethod
+    def event_text(event: Event) -> str:
+        return (
+            f"Нагадування про подію!\n\n"
+            f"📅 {event.date_str}: {event.title}"
+        )
+
+    def due_items(self, current_date: date) -> list:
+        """
+        Нагадування, що припадають на current_date, — по одному на запис і правило.
+        Кожне має ключ (вид, дата, запис, зсув, чат, тема) для дедуплікації.
+        """
+        by_lead = {}
+        for rule in self.rules:
+            by_lead.setdefault(rule.lead_days, []).append(rule)
+
+        items = []
+        revision = self.store.current_revision()
+        for lead_days, rules in sorted(by_lead.items()):
+            target = current_date + timedelta(days=lead_days)
+            kinds = {kind for rule in rules for kind in rule.kinds}
+            found = {REMINDER_SERMON: [], REMINDER_EVENT: []}
+            if REMINDER_SERMON in kinds:
+                found[REMINDER_SERMON] = [
+                    (entry.date_str, "", render_cache.get_or_render(
+                        (REMINDER_SERMON, entry, revision), lambda: self.sermon_text(entry)
+                    ))
+                    for entry in self.store.schedule_between(target, target)
+                ]
+            if REMINDER_EVENT in kinds:
+                found[REMINDER_EVENT] = [
+                    (event.date_str, event.title, render_cache.get_or_render(
+                        (REMINDER_EVENT, event, revision), lambda: self.event_text(event)
+                    ))
+                    for event in self.store.events_between(target, target)
+                ]
+            for rule in rules:
+                for kind in rule.kinds:
+                    for date_str, title, text in found[kind]:
+                        items.append({
+                            "key": "|".join(map(str, (
+                                kind, date_str, title, lead_days, rule.chat_id, rule.thread_id
+                            ))),
+                            "chat_id": rule.chat_id,
+                            "thread_id": rule.thread_id,
+                            "day": target.toordinal(),
+                            "text": text,
+                        })
+        return items
+
+class ReminderOutbox:
+    """
+    Черга нагадувань на диску (JSON по рядку, лише дописування).
+    Нагадування записується сюди до відправки і позначається після доставки,
+    тож перезапуск не дублює вже надіслане, а невдалі спроби повторюються.
+    Також зберігається останній оброблений день — для надолуження простою.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.last_run = None   # порядковий номер дня
+        self._items = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        count_bytes(self.path, "read", os.path.getsize(self.path))
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # обірваний запис
+                op = record.pop("op")
+                if op == "add":
+                    record["sent"] = False
+                    self._items[record["key"]] = record
+                elif op == "sent":
+                    for key in record["keys"]:
+                        if key in self._items:
+                            self._items[key]["sent"] = True
+                elif op == "run":
+                    self.last_run = record["day"]
+
+    def _append(self, records: list):
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        count_bytes(self.path, "write", len(data))
+
+    def add(self, items: list):
+        """Додає нові нагадування; ті, що вже є (за ключем), ігноруються."""
+        new_items = [item for item in items if item["key"] not in self._items]
+        if not new_items:
+            return
+        self._append([{"op": "add", **item} for item in new_items])
+        for item in new_items:
+            self._items[item["key"]] = {**item, "sent": False}
+
+    def mark_sent(self, keys: list):
+        if not keys:
+            return
+        self._append([{"op": "sent", "keys": keys}])
+        for key in keys:
+            self._items[key]["sent"] = True
+
+    def set_last_run(self, day: int):
+        self._append([{"op": "run", "day": day}])
+        self.last_run = day
+
+    def pending(self, min_day: int) -> list:
+        """Недоставлені нагадування про записи не раніше min_day, у порядку додавання."""
+        return [
+            item for item in self._items.values()
+            if not item["sent"] and item["day"] >= min_day
+        ]
+
+    def compact(self, min_day: int):
+        """Переписує файл, відкидаючи нагадування про дні до min_day."""
+        self._items = {k: v for k, v in self._items.items() if v["day"] >= min_day}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in self._items.values():
+                record = {k: v for k, v in item.items() if k != "sent"}
+                f.write(json.dumps({"op": "add", **record}, ensure_ascii=False) + "\n")
+            sent = [key for key, item in self._items.items() if item["sent"]]
+            if sent:
+                f.write(json.dumps({"op": "sent", "keys": sent}, ensure_ascii=False) + "\n")
+            if self.last_run is not None:
+                f.write(json.dumps({"op": "run", "day": self.last_run}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            count_bytes(self.path, "write", f.tell())
+        os.replace(tmp_path, self.path)
+
+def join_chunks(parts: list, separator: str, limit: int = MESSAGE_LIMIT) -> list:
+    """Склеює частини через separator у повідомлення не довші за limit."""
+    chunks = []
+    current = ""
+    for part in parts:
+        candidate = f"{current}{separator}{part}" if current else part
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        while len(part) > limit:
+            chunks.append(part[:limit])
+            part = part[limit:]
+        current = part
+    if current:
+        chunks.append(current)
+    return chunks
+
+class TokenBucket:
+    """Відро токенів: не більше rate операцій за секунду з піком до capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class ReminderSender:
+    """
+    Надсилання нагадувань: різні чати обслуговуються паралельно,
+    в межах одного чату — по черзі (зберігається порядок).
+    Ліміти Telegram: ~30 повідомлень/с загалом і ~20/хв в одну групу.
+    На RetryAfter чекаємо вказаний час, на мережеві помилки — повтор
+    з експоненційною затримкою; помилка одного повідомлення не зупиняє інші.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 20 / 60,
+                 max_attempts: int = 5, base_delay: float = 1.0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self._chat_buckets = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 3)
+        return bucket
+
+    async def send_one(self, bot, chat_id: int, thread_id, text: str) -> bool:
+        """Надсилає одне повідомлення з повторами; True, якщо доставлено."""
+        for attempt in range(1, self.max_attempts + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, message_thread_id=thread_id, text=text)
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+                metrics.inc("bot_reminder_retries_total", reason="retry_after")
+            except (BadRequest, Forbidden) as e:
+                print(f"Нагадування в чат {chat_id} не надіслано: {e}")
+                return False
+            except TelegramError as e:
+                delay = self.base_delay * 2 ** (attempt - 1)
+                print(f"Помилка надсилання в чат {chat_id} (спроба {attempt}): {e}")
+                metrics.inc("bot_reminder_retries_total", reason="network")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+        print(f"Нагадування в чат {chat_id} не надіслано після {self.max_attempts} спроб.")
+        return False
+
+    async def send_all(self, bot, messages: list) -> list:
+        """
+        Надсилає список (chat_id, thread_id, текст).
+        Повертає список True/False у тому ж порядку.
+        """
+        results = [False] * len(messages)
+        by_chat = {}
+        for i, (chat_id, thread_id, text) in enumerate(messages):
+            by_chat.setdefault(chat_id, []).append((i, thread_id, text))
+
+        async def send_chat(chat_id, items):
+            for i, thread_id, text in items:
+                started = time_module.perf_counter()
+                results[i] = await self.send_one(bot, chat_id, thread_id, text)
+                metrics.observe("bot_reminder_send_seconds", time_module.perf_counter() - started)
+                metrics.inc("bot_reminders_total", result="sent" if results[i] else "failed")
+
+        await asyncio.gather(*(send_chat(c, items) for c, items in by_chat.items()))
+        return results
+
+try:
+    reminders = ReminderEngine(store, parse_reminder_rules(REMINDER_RULES))
+except ValueError as e:
+    print(f"Помилка: невірне значення REMINDER_RULES ({e}).")
+    exit(1)
+
+reminder_sender = ReminderSender()
+reminder_outbox = ReminderOutbox(REMINDER_OUTBOX_FILE)
+_reminder_lock = asyncio.Lock()
+
+def batch_reminders(items: list) -> list:
+    """
+    Групує нагадування за чатом/темою і склеює їх у повідомлення до ліміту.
+    Повертає список (chat_id, thread_id, текст, [ключі]).
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault((item["chat_id"], item["thread_id"]), []).append(item)
+    messages = []
+    for (chat_id, thread_id), group in groups.items():
+        text, keys = "", []
+        for item in group:
+            candidate = f"{text}\n\n{item['text']}" if text else item["text"]
+            if len(candidate) <= MESSAGE_LIMIT:
+                text, keys = candidate, keys + [item["key"]]
+                continue
+            if text:
+                messages.append((chat_id, thread_id, text, keys))
+            # Задовге нагадування йде кількома повідомленнями з тим самим ключем
+            *parts, text = join_chunks([item["text"]], "")
+            for part in parts:
+                messages.append((chat_id, thread_id, part, [item["key"]]))
+            keys = [item["key"]]
+        if text:
+            messages.append((chat_id, thread_id, text, keys))
+    return messages
+
+def queue_reminders(current_day: int, last_day: int) -> list:
+    """Ставить у outbox нагадування до last_day і повертає недоставлені, згруповані в повідомлення."""
+    first_day = current_day
+    if reminder_outbox.last_run is not None:
+        first_day = max(reminder_outbox.last_run + 1, last_day - REMINDER_CATCHUP_DAYS)
+    for day in range(first_day, last_day + 1):
+        items = reminders.due_items(date.fromordinal(day))
+        reminder_outbox.add([item for item in items if item["day"] >= current_day])
+    if first_day <= last_day:
+        reminder_outbox.set_last_run(last_day)
+    return batch_reminders(reminder_outbox.pending(current_day))
+
+async def deliver_reminders(bot, through_date: date):
+    """
+    Ставить в outbox нагадування за всі дні від останнього запуску до
+    through_date (не більше REMINDER_CATCHUP_DAYS) і надсилає недоставлені.
+    Нагадування про дати, що вже минули, не надсилаються.
+    """
+    async with _reminder_lock:
+        current_day = today().toordinal()
+        messages = await asyncio.to_thread(queue_reminders, current_day, through_date.toordinal())
+        results = await reminder_sender.send_all(
+            bot, [(chat_id, thread_id, text) for chat_id, thread_id, text, _ in messages]
+        )
+        delivered = {}
+        for (_, _, _, keys), ok in zip(messages, results):
+            for key in keys:
+                delivered[key] = delivered.get(key, True) and ok
+        await asyncio.to_thread(
+            reminder_outbox.mark_sent, [key for key, ok in delivered.items() if ok]
+        )
+
+        failed = results.count(False)
+        if failed:
+            print(f"Не надіслано нагадувань: {failed} з {len(messages)}")
 
 async def remind(context: ContextTypes.DEFAULT_TYPE):
+    # Наївний REMINDER_TIME JobQueue трактує як UTC
+    tz = REMINDER_TIME.tzinfo or timezone.utc
+    now = datetime.now(tz)
+    scheduled = datetime.combine(now.date(), REMINDER_TIME.replace(tzinfo=tz))
+    metrics.set("bot_job_lag_seconds", max(0.0, (now - scheduled).total_seconds()), job="remind")
     try:
-        current_date = datetime.now().date()
-
-        # Нагадування про проповіді
-        schedule = load_schedule()
-        for date, preachers in schedule.items():
-            schedule_date = datetime.strptime(date, "%d.%m.%Y").date()
-            if (schedule_date - current_date).days == 2:
-                preachers_list = ", ".join(preachers)
-                await context.bot.send_message(
-                    chat_id=GROUP_CHAT_ID,
-                    message_thread_id=REMINDER_THREAD_ID,
-                    text=(
-                        f"Нагадування!\n\n"
-                        f"На зібранні {date}:\n"
-                        f"Проповідують: {preachers_list}"
-                    )
-                )
-
-        # Нагадування про церковні події
-        events = load_events()
-        for event in events:
-            event_date = datetime.strptime(event["date"], "%d.%m.%Y").date()
-            if (event_date - current_date).days == 2:
-                await context.bot.send_message(
-                    chat_id=GROUP_CHAT_ID,
-                    message_thread_id=REMINDER_THREAD_ID,
-                    text=(
-                        f"Нагадування про подію!\n\n"
-                        f"📅 {event['date']}: {event['title']}"
-                    )
-                )
+        await deliver_reminders(context.bot, today())
 
     except Exception as e:
         print(f"Помилка у функції remind: {e}")
 
+async def catch_up_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Після старту: надолужує нагадування, пропущені поки бот не працював.
+    Сьогоднішні надсилаються лише якщо їхній час (REMINDER_TIME) уже минув.
+    """
+    try:
+        now = datetime.now(LOCAL_TZ)
+        through_date = now.date()
+        if now.time() < REMINDER_TIME.replace(tzinfo=None):
+            through_date -= timedelta(days=1)
+        async with _reminder_lock:
+            await asyncio.to_thread(reminder_outbox.compact, today().toordinal())
+        await deliver_reminders(context.bot, through_date)
+
+    except Exception as e:
+        print(f"Помилка у функції catch_up_reminders: {e}")
+
+_last_state_flush = None
+
+async def flush_states(context: ContextTypes.DEFAULT_TYPE):
+    """Періодично прибирає прострочені діалоги і зберігає стани на диск."""
+    global _last_state_flush
+    now = time_module.monotonic()
+    if _last_state_flush is not None:
+        lag = now - _last_state_flush - STATE_FLUSH_SECONDS
+        metrics.set("bot_job_lag_seconds", max(0.0, lag), job="flush_states")
+    _last_state_flush = now
+    user_states.expire()
+    await asyncio.to_thread(user_states.flush)
+
+async def save_states_on_shutdown(application: Application):
+    user_states.flush()
+
+async def drain_reminders(application: Application):
+    """Після зупинки: чекає, поки завершиться розсилка нагадувань, що вже йде."""
+    async with _reminder_lock:
+        pass
+
+def build_web_app(application: Application, secret: str):
+    """
+    HTTP-сервер режиму webhook (tornado, залежність python-telegram-bot[webhooks]):
+    POST WEBHOOK_PATH — оновлення від Telegram, GET HEALTH_PATH — перевірка для Fly.
+    Оновлення без заголовка з secret відхиляються: інакше будь-хто міг би
+    надіслати підроблене оновлення "з адмін-групи".
+    """
+    from tornado.web import Application as WebApplication, RequestHandler
+
+    class WebhookHandler(RequestHandler):
+        async def post(self):
+            token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+            if token is None or not hmac.compare_digest(token, secret):
+                self.set_status(403)
+                return
+            try:
+                update = Update.de_json(json.loads(self.request.body), application.bot)
+            except ValueError:
+                self.set_status(400)
+                return
+            await application.update_queue.put(update)
+
+    class HealthHandler(RequestHandler):
+        def get(self):
+            if not application.running:
+                self.set_status(503)
+            self.write("ok" if application.running else "stopping")
+
+    return WebApplication([
+        (rf"{WEBHOOK_PATH}/?", WebhookHandler),
+        (rf"{HEALTH_PATH}/?", HealthHandler),
+    ])
+
+async def run_webhook_server(application: Application):
+    """
+    Життєвий цикл бота в режимі webhook. На SIGTERM/SIGINT сервер перестає
+    приймати запити, Application.stop() дообробляє вже отримані оновлення і
+    чекає завершення задач, а post_stop — поточної розсилки нагадувань.
+    Webhook у Telegram не видаляється: оновлення, що надійдуть під час
+    перезапуску, Telegram доставить повторно (вже з секретом, який новий
+    процес передав у set_webhook).
+    """
+    from tornado.httpserver import HTTPServer
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Telegram дозволяє в секреті лише A-Z, a-z, 0-9, "_" і "-" — як у token_urlsafe
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.bot.set_webhook(
+        url=WEBHOOK_URL + WEBHOOK_PATH,
+        secret_token=secret,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    await application.start()
+    server = HTTPServer(build_web_app(application, secret))
+    server.listen(WEBHOOK_PORT)
+    print(f"Webhook: {WEBHOOK_URL}{WEBHOOK_PATH}, порт {WEBHOOK_PORT}")
+    try:
+        await stop.wait()
+    finally:
+        server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def start_metrics_server():
+    """
+    HTTP-ендпоінт GET /metrics для Prometheus на METRICS_HOST:METRICS_PORT.
+    Працює в окремому потоці (стандартний http.server), тож не залежить
+    від режиму бота (polling чи webhook) і не навантажує цикл подій.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0].rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # кожен збір метрик у лог не пишемо
+
+    server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/metrics — зведення метрик (кількість, середнє і p95 для гістограм)."""
+    if not is_admin_chat(update):
+        return
+    lines = metrics.summary()
+    if not lines:
+        await update.message.reply_text("Метрик ще немає.")
+        return
+    for chunk in join_chunks(lines, "\n"):
+        await update.message.reply_text(chunk)
+
 # Обробник невідомої команди
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Невідома команда. Використайте /help, щоб переглянути список доступних команд."
     )
 
+def _rss_kb() -> int:
+    """Поточна резидентна пам'ять процесу (КБ); без /proc — пікова."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def import_timings(importtime_output: str) -> list:
+    """
+    [(мкс разом із вкладеними, модуль), ...] з виводу python -X importtime —
+    лише імпорти верхнього рівня і їхні прямі вкладені.
+    """
+    timings = []
+    for line in importtime_output.splitlines():
+        fields = line.split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or "cumulative" in line:
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue  # глибший імпорт — уже врахований у батьківському
+        timings.append((int(fields[1]), name.strip()))
+    return timings
+
+def profile_startup(top: int = 15):
+    """
+    python main.py --profile-startup — звіт про холодний старт без запуску бота:
+    час імпорту модулів (python -X importtime в окремому процесі, найдовші
+    імпорти верхнього рівня) і пам'ять після ініціалізації сховища та реєстру.
+    Окремо — скільки коштує відкладений імпорт python-docx для /export.
+    """
+    import subprocess
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True,
+    )
+    timings = sorted(import_timings(result.stderr), reverse=True)
+    total = next((us for us, name in timings if name == "main"), None)
+    print("Час імпорту (мс, разом із вкладеними імпортами):")
+    for cumulative_us, name in timings[:top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+    if total is not None:
+        print(f"Імпорт main разом: {total / 1000:.1f} мс")
+
+    print(f"Пам'ять після ініціалізації: {_rss_kb() / 1024:.1f} МБ")
+    print(f"python-docx завантажено при старті: {'так' if 'docx' in sys.modules else 'ні'}")
+    started = time_module.perf_counter()
+    rss_before = _rss_kb()
+    import docx  # noqa: F401 — лише для виміру
+    print(
+        f"Перший /export docx додасть: {(time_module.perf_counter() - started) * 1000:.1f} мс, "
+        f"{(_rss_kb() - rss_before) / 1024:.1f} МБ"
+    )
+
 def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+    if "--profile-startup" in sys.argv:
+        profile_startup()
+        return
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_stop(drain_reminders)
+        .post_shutdown(save_states_on_shutdown)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -735,18 +3942,45 @@ def main():
     application.add_handler(CommandHandler("get_chat_id", get_chat_id))
     application.add_error_handler(error_handler)
     
-    application.job_queue.run_repeating(remind, interval=24*60*60, first=10)
-    # application.job_queue.run_repeating(remind, interval=10 )
+    application.job_queue.run_daily(timed(remind, "job"), time=REMINDER_TIME)
+    application.job_queue.run_once(timed(catch_up_reminders, "job"), when=10)
+    application.job_queue.run_repeating(timed(flush_states, "job"), interval=STATE_FLUSH_SECONDS)
     
     application.add_handler(CommandHandler("export", export_table_command))
     application.add_handler(CommandHandler("add_event", add_event_command))
     application.add_handler(CommandHandler("show_events", show_events_command))
     application.add_handler(CommandHandler("delete_event", delete_event_command))
+    application.add_handler(CommandHandler("preachers", preachers_command))
+    application.add_handler(CommandHandler("find", find_command))
+    application.add_handler(CommandHandler("free", free_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CallbackQueryHandler(page_callback, pattern=r"^page\|"))
+    application.add_handler(CallbackQueryHandler(delete_date_callback, pattern=r"^del\|"))
+    application.add_handler(CallbackQueryHandler(delete_event_callback, pattern=r"^dev\|"))
+    application.add_handler(CommandHandler("autoplan", autoplan_command))
+    application.add_handler(CommandHandler("blackout", blackout_command))
+    application.add_handler(CommandHandler("add_preacher", add_preacher_command))
+    application.add_handler(CommandHandler("rename_preacher", rename_preacher_command))
+    application.add_handler(CommandHandler("alias_preacher", alias_preacher_command))
+    application.add_handler(CommandHandler("deactivate_preacher", deactivate_preacher_command))
+    application.add_handler(CommandHandler("activate_preacher", activate_preacher_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
 
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
-  
-    application.run_polling()
+
+    # Тривалість і винятки кожного обробника — у bot_handler_seconds / bot_handler_errors_total
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(handler.callback)
+
+    if METRICS_PORT:
+        start_metrics_server()
+
+    if WEBHOOK_URL:
+        asyncio.run(run_webhook_server(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
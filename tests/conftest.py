@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py читає змінні середовища і створює файли сховища в поточному
+# каталозі при імпорті — тож спершу фіктивні змінні й тимчасовий каталог
+TEST_ENV = {"BOT_TOKEN": "123:test", "ADMIN_CHAT_ID": "1", "GROUP_CHAT_ID": "2"}
+os.environ.update(TEST_ENV)
+os.chdir(tempfile.mkdtemp(prefix="bot-tests-"))
+sys.path.insert(0, ROOT)
+
+import main  # noqa: E402
+
+
+def subprocess_env(**extra) -> dict:
+    """Оточення для дочірнього процесу, який імпортує main."""
+    return dict(os.environ, **TEST_ENV, PYTHONPATH=ROOT, **extra)
+
+
+def wait_for_compaction(store):
+    """Чекає, поки фонові ущільнення журналів TextStore завершаться."""
+    import time
+    deadline = time.monotonic() + 30
+    while getattr(store, "_compacting", None) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not getattr(store, "_compacting", None), "ущільнення не завершилось"
+
+
+def open_store(backend: str, path):
+    if backend == "sqlite":
+        return main.SqliteStore(str(path / "schedule.db"))
+    return main.TextStore(str(path / "schedule.txt"), str(path / "events.txt"))
+
+
+def pairs(store) -> set:
+    """Усі пари (день, проповідник) сховища."""
+    return {(entry.day, name) for entry in store.schedule_between() for name in entry.preachers}
+
+
+@pytest.fixture
+def small_journal(monkeypatch):
+    """Маленький поріг ущільнення, щоб тест проходив через багато ущільнень."""
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_BYTES", 2000)
@@ -0,0 +1,36 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import main
+from conftest import open_store, pairs, wait_for_compaction
+
+NAMES = ["Козак Є.", "Кулик Є.", "Волос В.", "Сардак Р."]
+
+
+@pytest.mark.parametrize("backend", ["text", "sqlite"])
+def test_parallel_adds_are_not_lost(tmp_path, small_journal, backend):
+    store = open_store(backend, tmp_path)
+    astore = main.AsyncStore(store)
+    sermons = {
+        (739000 + i // len(NAMES), NAMES[i % len(NAMES)]) for i in range(500)
+    }
+    events = {(739000 + i, f"Подія {i}") for i in range(300)}
+
+    async def add_all():
+        await asyncio.gather(
+            *(astore.add_preacher(date.fromordinal(day).strftime(main.DATE_FORMAT), name)
+              for day, name in sermons),
+            *(astore.add_event(date.fromordinal(day).strftime(main.DATE_FORMAT), title)
+              for day, title in events),
+        )
+
+    asyncio.run(add_all())
+    wait_for_compaction(store)
+
+    assert pairs(store) == sermons
+    assert {(e.day, e.title) for e in store.events_between()} == events
+    cold = open_store(backend, tmp_path)
+    assert pairs(cold) == sermons
+    assert {(e.day, e.title) for e in cold.events_between()} == events
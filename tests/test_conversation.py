@@ -0,0 +1,58 @@
+import asyncio
+import types
+
+import pytest
+
+import main
+
+USER = 10
+
+
+def message_update(text: str):
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    message = types.SimpleNamespace(text=text, reply_text=reply_text, message_thread_id=None)
+    update = types.SimpleNamespace(
+        message=message,
+        effective_chat=types.SimpleNamespace(id=main.ADMIN_CHAT_ID),
+        effective_user=types.SimpleNamespace(id=USER),
+    )
+    return update, replies
+
+
+@pytest.mark.parametrize("state", [
+    {"state": "waiting_for_preacher", "date": "05.03.2026"},
+    {"state": "waiting_for_preacher"},
+    {"state": "waiting_for_delete_decision", "date": 739000, "preachers": "Козак Є."},
+    {"state": "waiting_for_autoplan_confirm", "plan": [[739000, "Козак Є."]]},
+    {"state": "waiting_for_event_title", "date": True},
+    {"state": "no_such_step"},
+    "waiting_for_date",
+])
+def test_restored_state_with_wrong_payload_is_dropped(state):
+    main.user_states[USER] = state
+    update, replies = message_update("Козак Є.")
+    asyncio.run(main.handle_message(update, None))
+    assert USER not in main.user_states
+    assert replies == []
+
+
+def test_start_step_checks_field_types():
+    with pytest.raises(ValueError):
+        main.start_step(USER, "waiting_for_preacher", date="05.03.2026")
+    with pytest.raises(ValueError):
+        main.start_step(USER, "waiting_for_delete_decision", date=739000, preachers=[(1,)])
+    main.start_step(USER, "waiting_for_delete_decision", date=739000, preachers=[1, 2])
+    assert main.user_states.pop(USER)["preachers"] == [1, 2]
+
+
+def test_valid_state_is_dispatched():
+    main.start_step(USER, "waiting_for_event_title", date=739000)
+    update, replies = message_update("Свято")
+    asyncio.run(main.handle_message(update, None))
+    assert USER not in main.user_states
+    assert "Свято" in replies[0]
+    assert "Свято" in [event.title for event in main.store.events_between()]
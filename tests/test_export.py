@@ -0,0 +1,46 @@
+import asyncio
+import os
+import types
+
+import pytest
+
+import main
+
+
+def export(text: str) -> list:
+    """Виконує /export і повертає вміст надісланих документів."""
+    sent = []
+
+    async def send_document(document, **kwargs):
+        data = document if isinstance(document, (bytes, str)) else document.read()
+        sent.append(data)
+        return types.SimpleNamespace(document=types.SimpleNamespace(file_id=f"F{len(sent)}"))
+
+    async def reply_text(text, **kwargs):
+        sent.append(text)
+
+    update = types.SimpleNamespace(
+        message=types.SimpleNamespace(text=text, reply_text=reply_text),
+        effective_chat=types.SimpleNamespace(id=main.ADMIN_CHAT_ID),
+        effective_user=types.SimpleNamespace(id=10),
+    )
+    context = types.SimpleNamespace(bot=types.SimpleNamespace(send_document=send_document))
+    asyncio.run(main.export_table_command(update, context))
+    return sent
+
+
+@pytest.mark.skipif(not isinstance(main.store, main.TextStore), reason="перечитування txt файлів")
+def test_ics_export_sees_events_edited_on_disk():
+    main.store.add_event("10.04.2031", "Перша подія")
+    first = export("/export 04.2031 ics")
+    assert "Перша подія".encode() in first[0]
+
+    # Редагування events.txt ззовні (напр. вручну на сервері)
+    with open(main.EVENTS_FILE, "a", encoding="utf-8") as f:
+        f.write("12.04.2031|Додана вручну\n")
+    stat = os.stat(main.EVENTS_FILE)
+    os.utime(main.EVENTS_FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    second = export("/export 04.2031 ics")
+    assert isinstance(second[0], bytes), "повторно надіслано старий file_id"
+    assert "Додана вручну".encode() in second[0]
@@ -0,0 +1,97 @@
+import os
+import signal
+import subprocess
+import sys
+from datetime import date
+
+import main
+from conftest import pairs, subprocess_env, wait_for_compaction
+
+NAMES = ["Козак Є.", "Кулик Є.", "Волос В."]
+
+
+def test_compaction_keeps_every_entry(tmp_path, small_journal):
+    store = main.TextStore(str(tmp_path / "schedule.txt"), str(tmp_path / "events.txt"))
+    expected = set()
+    for i in range(3000):
+        day = 739000 + i // len(NAMES)
+        name = NAMES[i % len(NAMES)]
+        store.add_preacher(date.fromordinal(day).strftime(main.DATE_FORMAT), name)
+        expected.add((day, name))
+    wait_for_compaction(store)
+
+    assert os.path.getsize(tmp_path / "schedule.txt") > 10 * main.JOURNAL_COMPACT_BYTES
+    assert pairs(store) == expected
+    cold = main.TextStore(str(tmp_path / "schedule.txt"), str(tmp_path / "events.txt"))
+    assert pairs(cold) == expected
+
+
+# Дочірній процес дописує пачки в журнал і після кожного append_many
+# (тобто після fsync) повідомляє номер пачки
+WRITER = """
+import sys
+from main import Journal
+
+journal = Journal(sys.argv[1])
+batch = 0
+while True:
+    journal.append_many([("+", "01.01.2026", f"{batch}-{i}") for i in range(50)])
+    print(batch, flush=True)
+    batch += 1
+"""
+
+
+def test_kill_during_append_keeps_acknowledged_batches(tmp_path):
+    snapshot = tmp_path / "schedule.txt"
+    writer = subprocess.Popen(
+        [sys.executable, "-c", WRITER, str(snapshot)],
+        cwd=tmp_path, env=subprocess_env(), stdout=subprocess.PIPE, text=True,
+    )
+    acknowledged = -1
+    for line in writer.stdout:
+        acknowledged = int(line)
+        if acknowledged >= 200:
+            break
+    writer.send_signal(signal.SIGKILL)
+    writer.wait()
+    assert acknowledged >= 200
+
+    journal = main.Journal(str(snapshot))
+    batches = {}
+    for op, date_str, value in journal.records():
+        assert (op, date_str) == ("+", "01.01.2026")
+        batch, item = map(int, value.split("-"))
+        batches.setdefault(batch, []).append(item)
+    # Усі підтверджені пачки на місці; після них — щонайбільше одна (та, що писалась)
+    assert all(batches.get(b) == list(range(50)) for b in range(acknowledged + 1))
+    assert set(batches) <= set(range(acknowledged + 2))
+    assert open(journal.path, "rb").read().endswith(b"\n")
+
+
+def test_torn_tail_is_truncated_and_replay_continues(tmp_path):
+    journal = main.Journal(str(tmp_path / "schedule.txt"))
+    journal.append_many([("+", "01.01.2026", "Козак Є."), ("+", "04.01.2026", "Кулик Є.")])
+    with open(journal.path, "ab") as f:
+        f.write("+|08.01.2026|Воло".encode("utf-8"))  # запис, обірваний аварією
+
+    assert list(journal.records()) == [
+        ("+", "01.01.2026", "Козак Є."),
+        ("+", "04.01.2026", "Кулик Є."),
+    ]
+    journal.append("+", "11.01.2026", "Волос В.")
+    assert [value for _, _, value in journal.records()] == ["Козак Є.", "Кулик Є.", "Волос В."]
+
+
+def test_rotated_journal_is_replayed_after_crash(tmp_path):
+    # Аварія між rotate() і записом знімка: *.old лишився на диску
+    snapshot = tmp_path / "schedule.txt"
+    journal = main.Journal(str(snapshot))
+    journal.append("+", "01.01.2026", "Козак Є.")
+    journal.rotate()
+    journal.append("+", "04.01.2026", "Кулик Є.")
+
+    store = main.TextStore(str(snapshot), str(tmp_path / "events.txt"))
+    assert pairs(store) == {
+        (date(2026, 1, 1).toordinal(), "Козак Є."),
+        (date(2026, 1, 4).toordinal(), "Кулик Є."),
+    }
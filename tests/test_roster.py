@@ -0,0 +1,135 @@
+from datetime import date
+
+import pytest
+
+import main
+from conftest import open_store, wait_for_compaction
+
+DAY = date(2026, 3, 5)
+DATE_STR = DAY.strftime(main.DATE_FORMAT)
+
+
+@pytest.fixture
+def roster(tmp_path, monkeypatch):
+    """Окремий реєстр для тесту (сховища звертаються до main.roster)."""
+    fresh = main.Roster(str(tmp_path / "roster.txt"))
+    fresh.load(["Волос В.", "Козак Є."])
+    monkeypatch.setattr(main, "roster", fresh)
+    return fresh
+
+
+@pytest.mark.parametrize("backend", ["text", "sqlite"])
+def test_rename_changing_only_punctuation_keeps_rows(tmp_path, roster, backend):
+    store = open_store(backend, tmp_path)
+    store.add_preacher(DATE_STR, "Волос В.")
+
+    previous, preacher_id = roster.rename("Волос В.", "Волос В")
+    store.rename_preacher(preacher_id)
+    wait_for_compaction(store)
+
+    assert previous == "Волос В."
+    assert store.preachers_on(DATE_STR) == ["Волос В"]
+    assert store.preacher_days(preacher_id) == [DAY.toordinal()]
+    assert store.delete_preacher(DATE_STR, roster.name_of(preacher_id))
+    assert not store.has_schedule()
+
+
+@pytest.mark.parametrize("backend", ["text", "sqlite"])
+def test_merge_history_only_spelling(tmp_path, roster, backend):
+    if backend == "text":
+        (tmp_path / "schedule.txt").write_text(f"{DATE_STR}|Козак E\n", encoding="utf-8")
+    store = open_store(backend, tmp_path)
+    if backend == "sqlite":
+        store.add_preacher(DATE_STR, "Козак E")  # латинська E — окремий неактивний id
+    assert store.has_schedule()  # TextStore читає файли при першому зверненні
+    target = roster.find("Козак Є.")
+    source = roster.find("Козак E")
+    assert source not in (None, target)
+    assert not roster.add_alias("Козак Є.", "Козак E")
+    assert roster.rename("Козак E", "Козак Є.") is None
+
+    assert roster.merge("Козак E", "Козак Є.") == (source, target)
+    store.merge_preacher(source, target)
+    wait_for_compaction(store)
+
+    assert roster.find("Козак E") == target
+    assert "Козак E" not in [name for name, _, _ in roster.members()]
+    assert store.preachers_on(DATE_STR) == ["Козак Є."]
+    assert store.preacher_days(target) == [DAY.toordinal()]
+    assert store.preacher_totals([(2026, 3)])[target] == [1, 0, 0]
+
+    reloaded = main.Roster(str(tmp_path / "roster.txt"))
+    reloaded.load()
+    assert reloaded.find("Козак E") == reloaded.find("Козак Є.")
+
+
+def test_merge_refuses_active_source(roster):
+    assert roster.merge("Волос В.", "Козак Є.") is None
+    assert roster.merge("Невідомий", "Козак Є.") is None
+
+
+@pytest.mark.parametrize("alias", ["Козак|Є", "Козак;Є", "Козак-Є", "Козак,Є"])
+def test_alias_with_file_separators_is_rejected(roster, alias):
+    assert not roster.add_alias("Козак Є.", alias)
+    assert roster.rename("Козак Є.", alias.replace("-", "|")) is None
+    assert roster.find(alias) is None
+
+
+def test_malformed_roster_line_does_not_stop_loading(tmp_path):
+    path = tmp_path / "roster.txt"
+    path.write_text(
+        "Козак Є.|1|Козак|Є|\n"
+        "Волос В.|1|Волос|01.03.2026-31.03.2026;кінець\n"
+        "Кулик Є.\n",
+        encoding="utf-8",
+    )
+    loaded = main.Roster(str(path))
+    loaded.load()
+    assert [loaded.find(name) for name in ("Козак Є.", "Волос В.", "Кулик Є.")] == [0, 1, 2]
+    assert loaded.blackouts(1) == [(date(2026, 3, 1).toordinal(), date(2026, 3, 31).toordinal())]
+    assert not loaded.is_active(2)
+
+
+def test_merge_keeps_ids_stable_across_restart(tmp_path):
+    path = str(tmp_path / "roster.txt")
+    names = ["A.", "B.", "C.", "D."]
+    fresh = main.Roster(path)
+    fresh.load(names)
+    history_only = fresh.id_of("Bx")  # неактивне написання з історії
+    late = fresh.id_of("E")           # зареєстроване вже після нього
+    assert fresh.merge("Bx", "B.") == (history_only, 1)
+
+    reloaded = main.Roster(path)
+    reloaded.load()
+    assert [reloaded.find(name) for name in names] == [0, 1, 2, 3]
+    assert reloaded.find("E") == late
+    assert reloaded.find("Bx") == 1
+    assert "Bx" not in [name for name, _, _ in reloaded.members()]
+    assert reloaded.spellings(1) == ["B.", "Bx"]
+
+
+@pytest.mark.parametrize("backend", ["text", "sqlite"])
+def test_any_spelling_is_stored_under_the_roster_name(tmp_path, roster, backend):
+    roster.add("Басько П.")
+    roster.add_alias("Басько П.", "Босько П.")
+    store = open_store(backend, tmp_path)
+    store.add_preacher(DATE_STR, "Босько П.")
+    store.add_preacher(DATE_STR, "Басько П.")
+    store.add_preachers([(DATE_STR, "басько п")])
+
+    assert store.preachers_on(DATE_STR) == ["Басько П."]
+    assert store.preacher_totals([(2026, 3)])[roster.find("Басько П.")] == [1, 0, 0]
+    assert store.delete_preacher(DATE_STR, "басько п")
+    assert not store.delete_preacher(DATE_STR, "Невідомий")
+    assert not store.has_schedule()
+
+
+def test_sqlite_rewrites_old_spellings_once(tmp_path, roster):
+    store = open_store("sqlite", tmp_path)
+    store._conn.execute("DELETE FROM meta WHERE key = 'canonical_names'")
+    store._conn.executemany(
+        "INSERT INTO sermons (day, preacher) VALUES (?, ?)",
+        [(DAY.toordinal(), "козак є"), (DAY.toordinal(), "Козак Є.")],
+    )
+    reopened = open_store("sqlite", tmp_path)
+    assert reopened.preachers_on(DATE_STR) == ["Козак Є."]
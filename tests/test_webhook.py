@@ -0,0 +1,41 @@
+import asyncio
+import json
+import types
+
+from tornado.testing import AsyncHTTPTestCase
+
+import main
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1, "date": 0, "text": "/delete",
+        "chat": {"id": main.ADMIN_CHAT_ID, "type": "group"},
+    },
+}
+
+
+class WebhookTest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.application = types.SimpleNamespace(
+            bot=None, running=True, update_queue=asyncio.Queue(),
+        )
+        return main.build_web_app(self.application, "s3cret")
+
+    def post_update(self, headers=None):
+        return self.fetch(main.WEBHOOK_PATH, method="POST", body=json.dumps(UPDATE), headers=headers)
+
+    def test_update_without_secret_is_rejected(self):
+        self.assertEqual(self.post_update().code, 403)
+        self.assertEqual(self.post_update({"X-Telegram-Bot-Api-Secret-Token": "guess"}).code, 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    def test_update_with_secret_is_queued(self):
+        response = self.post_update({"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(self.application.update_queue.qsize(), 1)
+
+    def test_health(self):
+        self.assertEqual(self.fetch(main.HEALTH_PATH).code, 200)
+        self.application.running = False
+        self.assertEqual(self.fetch(main.HEALTH_PATH).code, 503)